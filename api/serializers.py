@@ -16,7 +16,7 @@ class MakeBookingSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = models.Booking
-        fields = ['id', 'date', 'carbay', 'customer', 'created_at']
+        fields = ['id', 'date', 'starts_at', 'ends_at', 'carbay', 'customer', 'created_at']
 
 
 class GetBookingsSerializer(MakeBookingSerializer):
@@ -0,0 +1,110 @@
+""" Server-Sent Events streams - served straight from ASGI (see config/asgi.py)
+
+GET /api/availability/stream/?date=YYYY-MM-DD
+Sends a `snapshot` event with the available car bays for the date, then a `booked` / `released`
+event whenever a car bay is booked or released for that date. One long-lived connection per
+display replaces polling /api/availability/.
+"""
+import asyncio
+import json
+from urllib.parse import parse_qs
+
+from asgiref.sync import sync_to_async
+from django.db import close_old_connections
+from django.utils import timezone
+
+from core import utils
+from core.broker import broker
+
+KEEPALIVE_SECONDS = 15
+
+
+def format_event(event: str, data: dict) -> bytes:
+    return f'event: {event}\ndata: {json.dumps(data)}\n\n'.encode()
+
+
+@sync_to_async
+def get_available_car_bays(date) -> list:
+    try:
+        return list(utils.get_available_car_bays(date).values_list('id', flat=True))
+    finally:  # not run through Django's request handler - clean up the connection ourselves
+        close_old_connections()
+
+
+async def send_error(send, message: str, status: int = 400):
+    await send({'type': 'http.response.start', 'status': status, 'headers': [(b'content-type', b'application/json')]})
+    await send({'type': 'http.response.body', 'body': json.dumps({'message': message}).encode()})
+
+
+async def availability_stream(scope, receive, send):
+    """ Stream of car bay availability changes for given booking date """
+    if scope['method'] != 'GET':
+        return await send_error(send, f'Method "{scope["method"]}" not allowed.', status=405)
+
+    params = parse_qs(scope.get('query_string', b'').decode())
+
+    # validation for `date` field
+    date = params.get('date', [''])[0]
+    if not date:
+        return await send_error(send, 'Please provide a date in the url query params /availability/stream/?date=YYYY-MM-DD')
+
+    try:  # convert `date` string to datetime object
+        date = timezone.datetime.strptime(date, '%Y-%m-%d')
+    except ValueError:
+        return await send_error(send, 'Invalid date format provided - Valid format date=YYYY-MM-DD')
+
+    if not date > timezone.now().today():
+        return await send_error(send, 'Given date must be in the future - e.g. tomorrow\'s date onwards')
+
+    # subscribe before taking the snapshot so no change is missed in between
+    queue = broker.subscribe(date.date())
+    try:
+        carbays = await get_available_car_bays(date)
+
+        await send({
+            'type': 'http.response.start',
+            'status': 200,
+            'headers': [
+                (b'content-type', b'text/event-stream'),
+                (b'cache-control', b'no-cache'),
+                (b'x-accel-buffering', b'no'),  # disable proxy (nginx) buffering
+            ],
+        })
+        snapshot = {'date': date.strftime('%Y-%m-%d'), 'count': len(carbays), 'data': carbays}
+        await send({'type': 'http.response.body', 'body': format_event('snapshot', snapshot), 'more_body': True})
+
+        disconnect = asyncio.ensure_future(wait_for_disconnect(receive))
+        get_event = asyncio.ensure_future(queue.get())
+        disconnected = False
+        try:
+            while True:
+                done, _ = await asyncio.wait({disconnect, get_event}, timeout=KEEPALIVE_SECONDS, return_when=asyncio.FIRST_COMPLETED)
+
+                if disconnect in done:
+                    disconnected = True
+                    break
+
+                if get_event in done:
+                    event = get_event.result()
+                    if event is None:  # subscriber overflowed - client reconnects for a fresh snapshot
+                        break
+                    await send({'type': 'http.response.body', 'body': format_event(event['event'], event), 'more_body': True})
+                    get_event = asyncio.ensure_future(queue.get())
+
+                else:  # keep the connection open through proxies
+                    await send({'type': 'http.response.body', 'body': b': keepalive\n\n', 'more_body': True})
+        finally:
+            disconnect.cancel()
+            get_event.cancel()
+
+        if not disconnected:
+            await send({'type': 'http.response.body', 'body': b'', 'more_body': False})
+    finally:
+        broker.unsubscribe(date.date(), queue)
+
+
+async def wait_for_disconnect(receive):
+    while True:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            return
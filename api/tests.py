@@ -1,13 +1,20 @@
-from datetime import timedelta
+import asyncio
+import json
+from datetime import date, timedelta
+from io import StringIO
+from unittest import mock
 
+from asgiref.sync import async_to_sync, sync_to_async
 from django.core.management import call_command
-from django.test import Client, TestCase
+from django.db import IntegrityError
+from django.test import Client, TestCase, override_settings
 from django.urls import reverse
 from django.utils import timezone
 
 from rest_framework import status
 
-from core import models, utils
+from api import serializers, streams
+from core import audit, factories, models, utils
 
 
 def generate_test_data(count: int = 3, timedelta_days: int = 1):
@@ -15,14 +22,14 @@ def generate_test_data(count: int = 3, timedelta_days: int = 1):
 
     customers = ['Alice', 'Bob', 'Charlie', 'Dave', 'Ed']
     for c in customers[:count]:
-        customer = models.Customer.objects.create(name=c, plate=f'{c[0]}23456789')
+        customer = factories.CustomerFactory(name=c, plate=f'{c[0]}23456789')
         carbay = utils.get_available_car_bays(booking_date).order_by('id').first()
 
         if not carbay:
             booking_date += timedelta(days=1)
             carbay = utils.get_available_car_bays(booking_date).order_by('id').first()
 
-        models.Booking.objects.create(date=booking_date, carbay=carbay, customer=customer)
+        factories.BookingFactory(date=booking_date, carbay=carbay, customer=customer)
 
 
 class CarBayAvailabilityAPITests(TestCase):
@@ -92,9 +99,8 @@ class CarBayAvailabilityAPITests(TestCase):
         AND response count equals to 0
         """
         date = timezone.now().today() + timedelta(days=1)
-        customer = models.Customer.objects.create(name='Dave', plate='D23456789')
         carbay = utils.get_available_car_bays(date).order_by('id').first()
-        models.Booking.objects.create(date=date, carbay=carbay, customer=customer)
+        factories.BookingFactory(date=date, carbay=carbay, customer__name='Dave', customer__plate='D23456789')
 
         response = self.client.get(reverse('api:availability'), {'date': date.strftime('%Y-%m-%d')})
         self.assertEqual(response.status_code, status.HTTP_200_OK)
@@ -165,9 +171,8 @@ class MakeBookingAPITests(TestCase):
         AND response message contains `Only 1 booking allowed per customer per day`
         """
         # setup the scenario - given:
-        customer = models.Customer.objects.create(**self.customer)
         carbay = utils.get_available_car_bays(self.tomorrow).order_by('id').first()
-        models.Booking.objects.create(date=self.tomorrow, carbay=carbay, customer=customer)
+        factories.BookingFactory(date=self.tomorrow, carbay=carbay, customer=factories.CustomerFactory(**self.customer))
 
         data = {'date': self.tomorrow_str, 'customer': self.customer}
 
@@ -219,6 +224,162 @@ class MakeBookingAPITests(TestCase):
         self.assertTrue(models.Booking.objects.filter(date=self.day_after_str, customer__plate=self.customer['plate']).exists())
 
 
+class ConcurrentBookingAPITests(TestCase):
+
+    def setUp(self):
+        self.day_after = (timezone.now().today() + timedelta(days=2)).date()
+        self.data = {'date': self.day_after.strftime('%Y-%m-%d'), 'customer': {'name': 'Zubair', 'plate': 'Z23456789'}}
+        self.client = Client()
+
+        # another customer (thread or worker) booked the first car bay after it was allocated to this request
+        self.bays = list(models.CarBay.objects.order_by('id').values_list('id', flat=True))
+        factories.BookingFactory(date=self.day_after, carbay_id=self.bays[0])
+
+    @classmethod
+    def setUpTestData(cls):
+        call_command('setup_car_bays')
+
+    def book(self, allocated: list):
+        """ Book with the car bays `allocated` in turn - the PostgreSQL `booking_no_overlap` constraint simulated on save """
+        save = serializers.MakeBookingSerializer.save
+
+        def save_no_overlap(serializer, **kwargs):
+            if models.Booking.objects.filter(date=self.day_after, carbay=serializer.validated_data['carbay']).exists():
+                raise IntegrityError(f'conflicting key value violates exclusion constraint "{models.Booking.NO_OVERLAP_CONSTRAINT}"')
+            return save(serializer, **kwargs)
+
+        with mock.patch('core.allocation.allocate_car_bay', side_effect=allocated) as allocate_car_bay, \
+                mock.patch.object(serializers.MakeBookingSerializer, 'save', autospec=True, side_effect=save_no_overlap):
+            response = self.client.post(reverse('api:book'), self.data, content_type='application/json')
+        return response, allocate_car_bay.call_count
+
+    def test_booking_retried_on_taken_car_bay(self):
+        """
+        GIVEN the first car bay booked by a concurrent request after it was allocated
+        WHEN the booking is saved
+        THEN another car bay is allocated and booked with 201 - Created status code
+        """
+        response, allocations = self.book([self.bays[0], self.bays[1]])
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.json()['data']['carbay'], self.bays[1])
+        self.assertEqual(allocations, 2)
+
+    def test_booking_attempts_exhausted(self):
+        """
+        GIVEN the car bay allocated to every attempt booked by a concurrent request
+        WHEN the booking is saved
+        THEN endpoint returns 400 status code after 3 attempts
+        AND response message contains `just booked`
+        """
+        response, allocations = self.book([self.bays[0]] * 3)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertTrue('just booked' in response.json()['message'])
+        self.assertEqual(allocations, 3)
+
+
+class TimeSlotBookingAPITests(TestCase):
+
+    def setUp(self):
+        self.day_after = timezone.now().today() + timedelta(days=2)
+        self.day_after_str = self.day_after.strftime('%Y-%m-%d')
+        self.client = Client()
+
+    @classmethod
+    def setUpTestData(cls):
+        call_command('setup_car_bays')
+
+    def book(self, plate: str, start: str, end: str):
+        data = {'date': self.day_after_str, 'start': start, 'end': end, 'customer': {'name': plate, 'plate': plate}}
+        return self.client.post(reverse('api:book'), data, content_type='application/json')
+
+    def test_invalid_time_slot(self):
+        """
+        GIVEN car bays initialized with no test data
+        WHEN a user makes a post request with an invalid time slot (missing end, not on the hour, ends before start, not a string)
+        THEN endpoint returns 400 status code
+        AND response message contains `time slot`
+        """
+        for start, end in [('09:00', ''), ('09:30', '11:00'), ('11:00', '09:00'), ('9am', '11:00'), (9, 11)]:
+            response = self.book('Z23456789', start, end)
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+            self.assertTrue('time slot' in response.json()['message'].lower())
+
+    def test_time_slot_bookings(self):
+        """
+        GIVEN all 4 car bays booked from 09:00 to 12:00
+        WHEN customers book 12:00 to 14:00 and 10:00 to 11:00
+        THEN the 12:00 to 14:00 booking succeeds with 201 - Created status code
+        AND the 10:00 to 11:00 booking fails with `No car bays available`
+        AND availability for 11:00 to 13:00 is 0 car bays, for 14:00 to 24:00 is 4 car bays and for the whole day is 0
+        """
+        for plate in ['A23456789', 'B23456789', 'C23456789', 'D23456789']:
+            self.assertEqual(self.book(plate, '09:00', '12:00').status_code, status.HTTP_201_CREATED)
+
+        response = self.book('E23456789', '12:00', '14:00')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertTrue(response.json()['data']['starts_at'].endswith('12:00:00+08:00'))
+
+        response = self.book('F23456789', '10:00', '11:00')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertTrue('No car bays available' in response.json()['message'])
+
+        for start, end, count in [('11:00', '13:00', 0), ('14:00', '24:00', 4), ('', '', 0)]:
+            response = self.client.get(reverse('api:availability'), {'date': self.day_after_str, 'start': start, 'end': end})
+            self.assertEqual(response.json()['count'], count)
+
+
+@override_settings(PARKD_AUDIT_ENABLED=True)
+class BookingAuditAPITests(TestCase):
+
+    def setUp(self):
+        self.day_after_str = (timezone.now().today() + timedelta(days=2)).strftime('%Y-%m-%d')
+        self.client = Client()
+
+    @classmethod
+    def setUpTestData(cls):
+        call_command('setup_car_bays')
+
+    def test_booking_attempts_audited(self):
+        """
+        GIVEN car bays initialized with no test data
+        WHEN a customer books a car bay and then books again for the same date
+        THEN nothing is written to the database until the audit log is flushed
+        AND the successful booking is audited with its allocated car bay and booking
+        AND the rejected booking is audited with its reason
+        """
+        data = {'date': self.day_after_str, 'customer': {'name': 'Alice', 'plate': 'A23456789'}}
+        booking = self.client.post(reverse('api:book'), data, content_type='application/json').json()['data']
+        rejected = self.client.post(reverse('api:book'), data, content_type='application/json').json()
+        self.assertEqual(models.BookingAuditEvent.objects.count(), 0)
+
+        audit.audit_log.flush()
+        success_event, rejected_event = models.BookingAuditEvent.objects.order_by('occurred_at')
+        self.assertEqual(success_event.outcome, models.BookingAuditEvent.SUCCESS)
+        self.assertEqual(success_event.carbay_id, booking['carbay'])
+        self.assertEqual(str(success_event.booking_id), booking['id'])
+        self.assertEqual(rejected_event.outcome, models.BookingAuditEvent.REJECTED)
+        self.assertEqual(rejected_event.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(rejected_event.reason, rejected['message'])
+        self.assertEqual(str(rejected_event.date), self.day_after_str)
+
+    def test_only_booking_attempts_audited(self):
+        """
+        GIVEN car bays initialized with no test data
+        WHEN a user makes a get request and a post request with an invalid date format
+        THEN only the post request is audited
+        AND its reason is the plain text of the date field error
+        """
+        self.client.get(reverse('api:book'))
+        data = {'date': '24-07-2030', 'customer': {'name': 'Alice', 'plate': 'A23456789'}}
+        response = self.client.post(reverse('api:book'), data, content_type='application/json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        audit.audit_log.flush()
+        event = models.BookingAuditEvent.objects.get()
+        self.assertEqual(event.reason, f'date: {response.json()["date"][0]}')
+        self.assertIsNone(event.date)
+
+
 class GetBookingsAPITests(TestCase):
 
     def setUp(self):
@@ -276,3 +437,262 @@ class GetBookingsAPITests(TestCase):
         self.assertTrue(booking_data['customer']['name'])
         self.assertTrue(booking_data['customer']['plate'])
         self.assertTrue(booking_data['date'])
+
+
+@override_settings(ROOT_URLCONF='config.urls_api')
+class APIOnlyURLsTests(TestCase):
+
+    def setUp(self):
+        self.client = Client()
+
+    def test_api_only_urls(self):
+        """
+        GIVEN the API-only url configuration (config.settings_api)
+        WHEN a user requests the api and the admin endpoints
+        THEN api endpoints are served
+        AND admin endpoint is not found
+        """
+        response = self.client.get(reverse('api:availability'))
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        response = self.client.get('/admin/')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+class AvailabilityStreamTests(TestCase):
+
+    def setUp(self):
+        self.tomorrow = timezone.now().today() + timedelta(days=1)
+        self.tomorrow_str = self.tomorrow.strftime('%Y-%m-%d')
+
+    @classmethod
+    def setUpTestData(cls):
+        call_command('setup_car_bays')
+
+    @staticmethod
+    def parse_events(messages: list) -> list:
+        body = b''.join(m.get('body', b'') for m in messages if m['type'] == 'http.response.body').decode()
+        events = []
+        for chunk in body.split('\n\n'):
+            lines = dict(line.split(': ', 1) for line in chunk.splitlines() if not line.startswith(':'))
+            if lines:
+                events.append((lines['event'], json.loads(lines['data'])))
+        return events
+
+    def stream(self, query_string: bytes, on_snapshot=None, changes: int = 0) -> list:
+        """ Run the stream app until the snapshot and `changes` events made by `on_snapshot` are sent, then disconnect """
+        messages = []
+
+        async def run():
+            received = asyncio.Condition()
+            incoming = asyncio.Queue()
+
+            async def send(message):
+                async with received:
+                    messages.append(message)
+                    received.notify_all()
+
+            async def wait_for_messages(count: int):
+                async with received:
+                    await asyncio.wait_for(received.wait_for(lambda: len(messages) >= count), timeout=5)
+
+            scope = {'type': 'http', 'method': 'GET', 'path': '/api/availability/stream/', 'query_string': query_string}
+            task = asyncio.ensure_future(streams.availability_stream(scope, incoming.get, send))
+
+            await wait_for_messages(2)  # response start and body (snapshot or error)
+            if on_snapshot:
+                await sync_to_async(on_snapshot)()
+                await wait_for_messages(2 + changes)
+
+            await incoming.put({'type': 'http.disconnect'})
+            await asyncio.wait_for(task, timeout=5)
+
+        async_to_sync(run)()
+        return messages
+
+    def test_invalid_date(self):
+        """
+        GIVEN /availability/stream/ endpoint exists
+        WHEN a user connects without providing `date` param
+        THEN endpoint returns 400 status code
+        AND response message contains `provide a date`
+        """
+        messages = self.stream(b'')
+        self.assertEqual(messages[0]['status'], status.HTTP_400_BAD_REQUEST)
+        self.assertTrue('provide a date' in json.loads(messages[1]['body'])['message'])
+
+    def test_stream_snapshot_and_changes(self):
+        """
+        GIVEN car bays initialized with no bookings
+        WHEN a user connects with valid `date` param
+        AND a car bay gets booked and released for that date
+        THEN endpoint streams `text/event-stream`
+        AND first event is the `snapshot` of 4 available car bays
+        AND `booked` and `released` events follow for the car bay
+        """
+        def book_and_release():
+            with self.captureOnCommitCallbacks(execute=True):
+                booking = factories.BookingFactory(date=self.tomorrow, carbay=models.CarBay.objects.first())
+            with self.captureOnCommitCallbacks(execute=True):
+                booking.delete()
+
+        messages = self.stream(f'date={self.tomorrow_str}'.encode(), on_snapshot=book_and_release, changes=2)
+        self.assertEqual(messages[0]['status'], status.HTTP_200_OK)
+        self.assertTrue((b'content-type', b'text/event-stream') in messages[0]['headers'])
+
+        events = self.parse_events(messages)
+        carbay = models.CarBay.objects.first().id
+        carbays = list(models.CarBay.objects.values_list('id', flat=True))
+        self.assertEqual(events[0], ('snapshot', {'date': self.tomorrow_str, 'count': 4, 'data': carbays}))
+        self.assertEqual([(e, d['carbay']) for e, d in events[1:]], [('booked', carbay), ('released', carbay)])
+
+    def test_stream_released_after_last_time_slot(self):
+        """
+        GIVEN car bays initialized with no bookings
+        WHEN a user connects with valid `date` param
+        AND a car bay gets booked for two time slots and both time slots are cancelled one after the other
+        THEN `booked` events follow for both time slots
+        AND a single `released` event follows once the last time slot is cancelled
+        """
+        def book_and_release_slots():
+            carbay = models.CarBay.objects.first()
+            day_start, _ = models.Booking.day_bounds(self.tomorrow)
+            bookings = []
+            for hours in [(9, 12), (12, 14)]:
+                with self.captureOnCommitCallbacks(execute=True):
+                    bookings.append(factories.BookingFactory(date=self.tomorrow, carbay=carbay,
+                                                             starts_at=day_start + timedelta(hours=hours[0]),
+                                                             ends_at=day_start + timedelta(hours=hours[1])))
+            for booking in bookings:
+                with self.captureOnCommitCallbacks(execute=True):
+                    booking.delete()
+
+        messages = self.stream(f'date={self.tomorrow_str}'.encode(), on_snapshot=book_and_release_slots, changes=3)
+
+        events = self.parse_events(messages)
+        self.assertEqual([e for e, _ in events[1:]], ['booked', 'booked', 'released'])
+        self.assertTrue(events[3][1]['starts_at'].endswith('12:00:00+08:00'))
+
+
+class OccupancyAnalyticsAPITests(TestCase):
+
+    def setUp(self):
+        self.client = Client()
+
+    @classmethod
+    def setUpTestData(cls):
+        call_command('setup_car_bays')
+        cls.bay_a, cls.bay_b = models.CarBay.objects.all()[:2]
+
+        # Monday: both car bays whole day - Tuesday: car bay A from 09:00 to 11:00
+        monday, tuesday = date(2030, 1, 7), date(2030, 1, 8)
+        # customer X books car bay A both days, customer Y car bay B on Monday
+        cls.customer_x, cls.customer_y = factories.CustomerFactory(), factories.CustomerFactory()
+        factories.BookingFactory(date=monday, carbay=cls.bay_a, customer=cls.customer_x)
+        factories.BookingFactory(date=monday, carbay=cls.bay_b, customer=cls.customer_y)
+        day_start, _ = models.Booking.day_bounds(tuesday)
+        cls.slot = factories.BookingFactory(date=tuesday, carbay=cls.bay_a, customer=cls.customer_x,
+                                            starts_at=day_start + timedelta(hours=9), ends_at=day_start + timedelta(hours=11))
+        call_command('refresh_occupancy', stdout=StringIO())
+
+    def get_occupancy(self, group_by: str) -> dict:
+        response = self.client.get(reverse('api:occupancy'), {'from': '2030-01-07', 'to': '2030-01-08', 'group_by': group_by})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response.json()
+
+    def test_invalid_params(self):
+        """
+        GIVEN /analytics/occupancy/ api endpoint exists
+        WHEN a user makes get requests without a date range, with `from` after `to` and with invalid `group_by`
+        THEN endpoint returns 400 status code
+        """
+        for params in [{}, {'from': '2030-01-08', 'to': '2030-01-07'}, {'from': '2030-01-07', 'to': '2030-01-08', 'group_by': 'plate'}]:
+            response = self.client.get(reverse('api:occupancy'), params)
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_occupancy(self):
+        """
+        GIVEN car bays A and B booked the whole Monday and car bay A booked 2 hours on Tuesday
+        WHEN a user makes get requests for Monday to Tuesday grouped by car bay, by customer and by weekday
+        THEN car bay A has 2 bookings of 26 hours and car bay B has 1 booking of 24 hours over the 48 hours
+        AND the other 2 car bays have no bookings
+        AND customer X has 2 bookings of 26 hours and customer Y 1 booking of 24 hours of the 4 car bays
+        AND Monday has 48 booked hours of the 4 car bays and Tuesday 2 hours
+        """
+        response_body = self.get_occupancy('carbay')
+        idle = [{'carbay': carbay.id, 'bookings': 0, 'booked_hours': 0.0, 'utilization': 0.0} for carbay in models.CarBay.objects.all()[2:]]
+        self.assertEqual(response_body['data'], [
+            {'carbay': self.bay_a.id, 'bookings': 2, 'booked_hours': 26.0, 'utilization': round(26 / 48, 4)},
+            {'carbay': self.bay_b.id, 'bookings': 1, 'booked_hours': 24.0, 'utilization': 0.5},
+        ] + idle)
+
+        response_body = self.get_occupancy('customer')
+        self.assertEqual(response_body['data'], [
+            {'customer': self.customer_x.id, 'bookings': 2, 'booked_hours': 26.0, 'utilization': round(26 / 192, 4)},
+            {'customer': self.customer_y.id, 'bookings': 1, 'booked_hours': 24.0, 'utilization': 0.125},
+        ])
+
+        response_body = self.get_occupancy('weekday')
+        self.assertEqual(response_body['data'], [
+            {'weekday': 'Monday', 'bookings': 2, 'booked_hours': 48.0, 'utilization': 0.5},
+            {'weekday': 'Tuesday', 'bookings': 1, 'booked_hours': 2.0, 'utilization': round(2 / 96, 4)},
+        ])
+
+    def test_refresh_moved_booking(self):
+        """
+        GIVEN daily occupancy refreshed
+        WHEN car bay B's Monday booking is moved to Wednesday
+        THEN the next (incremental) refresh updates Monday and Wednesday
+        AND the booking is only counted on Wednesday
+        """
+        models.Booking.objects.update(last_updated=timezone.now() - timedelta(hours=2))
+        models.OccupancyRefresh.objects.update(started_at=timezone.now() - timedelta(hours=1))
+
+        booking = models.Booking.objects.get(carbay=self.bay_b)
+        booking.date = date(2030, 1, 9)
+        booking.starts_at, booking.ends_at = models.Booking.day_bounds(booking.date)
+        booking.save()
+
+        call_command('refresh_occupancy', stdout=StringIO())
+        response = self.client.get(reverse('api:occupancy'), {'from': '2030-01-07', 'to': '2030-01-09', 'group_by': 'date'})
+        self.assertEqual([(d['date'], d['bookings']) for d in response.json()['data']],
+                         [('2030-01-07', 1), ('2030-01-08', 1), ('2030-01-09', 1)])
+
+    def test_long_date_range(self):
+        """
+        GIVEN daily occupancy refreshed
+        WHEN a user makes get requests for all dates grouped by weekday and by month
+        THEN the bookings are reported against the available time of the whole range without listing its days
+        """
+        params = {'from': '0001-01-01', 'to': '9999-12-31'}
+        response = self.client.get(reverse('api:occupancy'), {**params, 'group_by': 'weekday'})
+        mondays = (date(9999, 12, 31) - date(1, 1, 1)).days // 7 + 1  # 0001-01-01 is a Monday
+        self.assertEqual(response.json()['data'][0], {
+            'weekday': 'Monday', 'bookings': 2, 'booked_hours': 48.0, 'utilization': round(48 / (mondays * 4 * 24), 4),
+        })
+
+        response = self.client.get(reverse('api:occupancy'), {**params, 'group_by': 'month'})
+        self.assertEqual(response.json()['data'], [
+            {'month': '2030-01', 'bookings': 3, 'booked_hours': 50.0, 'utilization': round(50 / (31 * 4 * 24), 4)},
+        ])
+
+    def test_incremental_refresh(self):
+        """
+        GIVEN daily occupancy refreshed
+        WHEN the Tuesday booking is deleted and a Wednesday booking made
+        THEN the next (incremental) refresh updates Tuesday and Wednesday only
+        AND occupancy per date reflects the changes
+        """
+        # time passes after the refresh
+        models.Booking.objects.update(last_updated=timezone.now() - timedelta(hours=2))
+        models.OccupancyRefresh.objects.update(started_at=timezone.now() - timedelta(hours=1))
+
+        self.slot.delete()
+        factories.BookingFactory(date=date(2030, 1, 9), carbay=self.bay_b)
+
+        out = StringIO()
+        call_command('refresh_occupancy', stdout=out)
+        self.assertTrue('refreshed for 2 dates' in out.getvalue())
+
+        response = self.client.get(reverse('api:occupancy'), {'from': '2030-01-07', 'to': '2030-01-09', 'group_by': 'date'})
+        self.assertEqual([(d['date'], d['bookings']) for d in response.json()['data']], [('2030-01-07', 2), ('2030-01-09', 1)])
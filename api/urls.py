@@ -9,4 +9,5 @@ urlpatterns = [
     path('availability/', views.CarBayAvailableAPI.as_view(), name='availability'),
     path('book/', views.MakeBookingAPI.as_view(), name='book'),
     path('bookings/', views.GetBookingsAPI.as_view(), name='bookings'),
+    path('analytics/occupancy/', views.OccupancyAnalyticsAPI.as_view(), name='occupancy'),
 ]
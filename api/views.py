@@ -1,9 +1,28 @@
+from django.db import IntegrityError, transaction
 from django.utils import timezone
 from rest_framework import exceptions, status, views
 from rest_framework.response import Response
 
 from api import serializers
-from core import models, utils
+from core import allocation, analytics, audit, models, utils
+
+# attempts to save a booking - concurrent requests (threads or workers) may be allocated the same car bay
+BOOKING_ATTEMPTS = 3
+
+
+def get_time_slot(date, data) -> tuple:
+    """ Validated optional time slot (`start` and `end` as HH:MM) from request data - whole day by default """
+    start, end = data.get('start'), data.get('end')
+    if not start and not end:
+        return models.Booking.day_bounds(date)
+
+    if not start or not end:
+        raise exceptions.ValidationError({'message': 'Time slot must provide both `start` and `end` - format HH:MM'})
+
+    try:
+        return utils.get_time_slot(date, start, end)
+    except ValueError as e:
+        raise exceptions.ValidationError({'message': f'Invalid time slot provided - {e}'})
 
 
 class CarBayAvailableAPI(views.APIView):
@@ -26,8 +45,11 @@ class CarBayAvailableAPI(views.APIView):
         if not date > timezone.now().today():
             raise exceptions.ValidationError({'message': 'Given date must be in the future - e.g. tomorrow\'s date onwards'})
 
+        # optional time slot - whole day by default
+        starts_at, ends_at = get_time_slot(date, params)
+
         # car bay availability queryset
-        carbays = utils.get_available_car_bays(date)
+        carbays = utils.get_available_car_bays(date, starts_at=starts_at, ends_at=ends_at)
 
         response_message = 'Successfully retrieved available car bays' if carbays.exists() else 'No car bays available'
 
@@ -46,6 +68,9 @@ class MakeBookingAPI(views.APIView):
     def post(self, request, *args, **kwargs):
         data = request.data.copy()
 
+        # pop out the optional time slot to validate against the booking date later
+        time_slot = {'start': data.pop('start', None), 'end': data.pop('end', None)}
+
         # pop out the `customer` object and do validations
         customer = data.pop('customer', {})
         if not customer and not customer.get('plate', '') and not customer.get('name', ''):
@@ -72,25 +97,44 @@ class MakeBookingAPI(views.APIView):
         if not utils.check_advance_booking(date=booking_date, hours_in_advance=24):  # 24 hours in advance
             raise exceptions.ValidationError({'message': 'Booking must be made 24 hours in advance of booking date'})
 
-        available_car_bays = utils.get_available_car_bays(date=booking_date)
-        if not available_car_bays.exists():
+        starts_at, ends_at = get_time_slot(booking_date, time_slot)
+
+        allocated_car_bay = allocation.allocate_car_bay(date=booking_date, customer=customer_instance, starts_at=starts_at, ends_at=ends_at)
+        if not allocated_car_bay:
             raise exceptions.ValidationError({'message': f'No car bays available for this date: {booking_date}'})
-        allocated_car_bay = available_car_bays.order_by('id').first()
 
         # we can now save the data and finalize the booking
         if not customer_instance:
             customer_serializer.save()
 
-        data = {'customer': customer_serializer.instance.id, 'carbay': allocated_car_bay.id, 'date': booking_date}
-
-        booking_serializer = serializers.MakeBookingSerializer(data=data)
-        booking_serializer.is_valid(raise_exception=True)
-        booking_serializer.save()
+        for attempt in range(1, BOOKING_ATTEMPTS + 1):
+            data = {'customer': customer_serializer.instance.id, 'carbay': allocated_car_bay, 'date': booking_date,
+                    'starts_at': starts_at, 'ends_at': ends_at}
+
+            booking_serializer = serializers.MakeBookingSerializer(data=data)
+            booking_serializer.is_valid(raise_exception=True)
+            try:  # PostgreSQL `booking_no_overlap` constraint - car bay taken by a concurrent booking
+                with transaction.atomic():
+                    booking_serializer.save()
+                break
+            except IntegrityError as e:
+                if models.Booking.NO_OVERLAP_CONSTRAINT not in str(e):
+                    raise
+                if attempt == BOOKING_ATTEMPTS:
+                    raise exceptions.ValidationError({'message': 'Car bay was just booked by another customer - please try again'})
+
+            # allocate another car bay - the taken one is out of the free car bays until they are rebuilt
+            allocation.free_bays.booked(booking_date.isoformat(), allocated_car_bay)
+            allocated_car_bay = allocation.allocate_car_bay(date=booking_date, customer=customer_instance, starts_at=starts_at, ends_at=ends_at)
+            if not allocated_car_bay:
+                raise exceptions.ValidationError({'message': f'No car bays available for this date: {booking_date}'})
 
         response_data = {
             'data': {
                 'id': booking_serializer.instance.id,
                 'date': booking_serializer.instance.date,
+                'starts_at': booking_serializer.instance.starts_at,
+                'ends_at': booking_serializer.instance.ends_at,
                 'carbay': booking_serializer.instance.carbay.id,
                 'customer': customer_serializer.data,
                 'created_at': booking_serializer.instance.created_at
@@ -100,6 +144,11 @@ class MakeBookingAPI(views.APIView):
         }
         return Response(response_data, status=status.HTTP_201_CREATED)
 
+    def finalize_response(self, request, response, *args, **kwargs):
+        # audit every booking attempt - successful and rejected (buffered, written in the background)
+        audit.record_booking(request, response)
+        return super().finalize_response(request, response, *args, **kwargs)
+
 
 class GetBookingsAPI(views.APIView):
     """ API to get booking details for given date """
@@ -129,3 +178,39 @@ class GetBookingsAPI(views.APIView):
             'message': f'{response_message} for date={date.strftime("%Y-%m-%d")}',
         }
         return Response(response_data, status=status.HTTP_200_OK)
+
+
+class OccupancyAnalyticsAPI(views.APIView):
+    """ Occupancy analytics endpoint - utilization per car bay, customer, weekday, month or date for given date range """
+    http_method_names = ['get']
+
+    def get(self, request, *args, **kwargs):
+        params = request.query_params
+
+        # validation for `from` and `to` fields
+        dates = [params.get('from'), params.get('to')]
+        if not all(dates):
+            raise exceptions.ValidationError({'message': 'Please provide a date range in the url query params /analytics/occupancy/?from=YYYY-MM-DD&to=YYYY-MM-DD'})
+
+        try:  # convert `from` and `to` strings to date objects
+            date_from, date_to = (timezone.datetime.strptime(d, '%Y-%m-%d').date() for d in dates)
+        except ValueError:
+            raise exceptions.ValidationError({'message': 'Invalid date format provided - Valid format from=YYYY-MM-DD&to=YYYY-MM-DD'})
+
+        if date_from > date_to:
+            raise exceptions.ValidationError({'message': 'Date range `from` must not be after `to`'})
+
+        group_by = params.get('group_by', 'carbay')
+        if group_by not in analytics.GROUPS:
+            raise exceptions.ValidationError({'message': f'Invalid group_by provided - Valid values {", ".join(analytics.GROUPS)}'})
+
+        data = analytics.get_occupancy(date_from, date_to, group_by=group_by)
+
+        response_message = f'Successfully retrieved occupancy per {group_by}' if data else 'No occupancy found'
+
+        response_data = {
+            'count': len(data),
+            'data': data,
+            'message': f'{response_message} for from={date_from} to={date_to}',
+        }
+        return Response(response_data, status=status.HTTP_200_OK)
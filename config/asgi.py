@@ -1,5 +1,8 @@
 """ ASGI config for config project.
 It exposes the ASGI callable as a module-level variable named ``application``.
+
+Server-Sent Events streams are long-lived, so they are served by plain ASGI apps (see api/streams.py)
+and every other request is handled by Django.
 """
 import os
 
@@ -7,4 +10,17 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+from api import streams  # noqa: E402 - apps must be loaded first
+
+STREAMS = {
+    '/api/availability/stream/': streams.availability_stream,
+}
+
+
+async def application(scope, receive, send):
+    stream = STREAMS.get(scope['path']) if scope['type'] == 'http' else None
+    if stream:
+        return await stream(scope, receive, send)
+    return await django_application(scope, receive, send)
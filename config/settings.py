@@ -37,6 +37,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'core.middleware.ProfilingMiddleware',  # removed from the chain unless configured
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -119,7 +120,45 @@ USE_TZ = True
 STATIC_URL = 'static/'
 STATIC_ROOT = tempfile.gettempdir() + '/static'
 
+# Logging
+# https://docs.djangoproject.com/en/4.0/topics/logging/
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'core': {'handlers': ['console'], 'level': 'INFO'},
+    },
+}
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/4.0/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
+
+# Parkd project
+
+# Car bay allocation strategy for new bookings - lowest_id, round_robin, pack_by_zone or preferred_bay (see core/allocation.py)
+PARKD_ALLOCATION_STRATEGY = config('ALLOCATION_STRATEGY', default='lowest_id')
+
+# Length (minutes) time slot bookings are made in steps of
+PARKD_SLOT_MINUTES = config('SLOT_MINUTES', default=60, cast=int)
+
+# Seconds the in-process free car bays of a date are trusted before being rebuilt from the database
+PARKD_FREE_BAYS_TTL = config('FREE_BAYS_TTL', default=300, cast=int)
+
+# On-demand request profiling (see core/middleware.py) - disabled unless a token or a sample rate is set
+PARKD_PROFILING_TOKEN = config('PROFILING_TOKEN', default='')
+PARKD_PROFILING_SAMPLE_RATE = config('PROFILING_SAMPLE_RATE', default=0.0, cast=float)
+PARKD_PROFILING_DIR = config('PROFILING_DIR', default='')
+
+# Booking audit log (see core/audit.py) - buffered in-process and written in batches by a background thread
+PARKD_AUDIT_ENABLED = config('AUDIT_ENABLED', default=True, cast=bool)
+PARKD_AUDIT_FILE = config('AUDIT_FILE', default='')  # append JSON lines to this file instead of the database
+PARKD_AUDIT_BATCH_SIZE = config('AUDIT_BATCH_SIZE', default=500, cast=int)
+PARKD_AUDIT_FLUSH_INTERVAL = config('AUDIT_FLUSH_INTERVAL', default=1.0, cast=float)  # seconds
+PARKD_AUDIT_MAX_EVENTS = config('AUDIT_MAX_EVENTS', default=10000, cast=int)
@@ -0,0 +1,41 @@
+""" Django settings for lean API-only workers.
+Usage: DJANGO_SETTINGS_MODULE=config.settings_api
+
+The API is stateless JSON, so the workers skip the admin, sessions, messages, staticfiles and
+templates machinery along with their middleware. This cuts worker cold-start time and memory.
+Database migrations and bootstrapping are run separately by `python manage.py init_parkd`
+(with the default `config.settings`) before the workers are started.
+"""
+from config.settings import *  # noqa: F401,F403
+
+
+# Application definition
+
+INSTALLED_APPS = [
+    # libraries
+    'django_filters',
+    'rest_framework',
+    # project
+    'core',
+]
+
+MIDDLEWARE = [
+    'core.middleware.ProfilingMiddleware',  # removed from the chain unless configured
+    'django.middleware.security.SecurityMiddleware',
+    'django.middleware.common.CommonMiddleware',
+]
+
+ROOT_URLCONF = 'config.urls_api'
+
+TEMPLATES = []
+
+
+# Django REST framework - JSON only, no authentication (see README assumptions)
+
+REST_FRAMEWORK = {
+    'DEFAULT_RENDERER_CLASSES': ['rest_framework.renderers.JSONRenderer'],
+    'DEFAULT_PARSER_CLASSES': ['rest_framework.parsers.JSONParser'],
+    'DEFAULT_AUTHENTICATION_CLASSES': [],
+    'DEFAULT_PERMISSION_CLASSES': ['rest_framework.permissions.AllowAny'],
+    'UNAUTHENTICATED_USER': None,
+}
@@ -0,0 +1,57 @@
+""" Django settings for running the automated tests.
+Usage: python manage.py test --settings=config.settings_test --parallel
+
+Runs on an in-memory SQLite database by default so no PostgreSQL server (or docker) is needed.
+Set `TEST_DATABASE=postgres` to run against PostgreSQL instead, optionally cloning the test
+database from a prepared template database with `POSTGRES_TEST_TEMPLATE=<db name>`.
+"""
+import os
+
+# base settings require these to be defined - provide harmless defaults for the test run
+os.environ.setdefault('SECRET_KEY', 'parkd-test-secret-key')
+os.environ.setdefault('POSTGRES_DB', 'parkd')
+os.environ.setdefault('POSTGRES_USER', 'postgres')
+os.environ.setdefault('POSTGRES_PASSWORD', 'postgres')
+
+from config.settings import *  # noqa: E402,F401,F403
+from decouple import config  # noqa: E402
+
+DEBUG = False
+
+
+# Database
+# SQLite in-memory is cloned per process by `manage.py test --parallel`
+
+TEST_DATABASE = config('TEST_DATABASE', default='sqlite')
+
+if TEST_DATABASE == 'sqlite':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': ':memory:',
+        }
+    }
+else:  # postgres
+    DATABASES['default']['TEST'] = {
+        'TEMPLATE': config('POSTGRES_TEST_TEMPLATE', default=None),
+    }
+
+
+# Fast (insecure) password hashing - only ever used for the test run
+
+PASSWORD_HASHERS = [
+    'django.contrib.auth.hashers.MD5PasswordHasher',
+]
+
+AUTH_PASSWORD_VALIDATORS = []
+
+
+# Parkd project
+
+# Test cases roll back their bookings - always build free car bays from the database
+PARKD_FREE_BAYS_TTL = 0
+
+# Booking audit log is enabled by the audit test cases only - without the background writer thread,
+# they flush the audit log themselves inside their transaction
+PARKD_AUDIT_ENABLED = False
+PARKD_AUDIT_FLUSH_INTERVAL = 0
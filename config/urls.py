@@ -1,6 +1,7 @@
 """ config URL Configuration
 """
 from django.contrib import admin
+from django.contrib.staticfiles.urls import staticfiles_urlpatterns
 from django.urls import include, path
 
 urlpatterns = [
@@ -8,3 +9,6 @@ urlpatterns = [
     path('api-auth/', include('rest_framework.urls')),
     path('api/', include('api.urls')),
 ]
+
+# serve admin / browsable API staticfiles in DEBUG mode (no runserver)
+urlpatterns += staticfiles_urlpatterns()
@@ -0,0 +1,7 @@
+""" config URL Configuration for API-only workers (config.settings_api)
+"""
+from django.urls import include, path
+
+urlpatterns = [
+    path('api/', include('api.urls')),
+]
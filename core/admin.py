@@ -6,3 +6,5 @@ from core import models
 admin.site.register(models.CarBay)
 admin.site.register(models.Customer)
 admin.site.register(models.Booking)
+admin.site.register(models.DailyOccupancy)
+admin.site.register(models.BookingAuditEvent)
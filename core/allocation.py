@@ -0,0 +1,212 @@
+""" Car bay allocation for new bookings
+
+Free car bays of each booking date are kept in an in-process `FreeBays` structure, built from the
+database once and then updated incrementally from the booked/released availability events (see
+core/broker.py), so choosing a car bay does not scan the bookings. The strategy picking a car bay
+from the free ones is set by the `PARKD_ALLOCATION_STRATEGY` setting.
+"""
+import bisect
+import datetime
+import threading
+import time
+from collections import OrderedDict, defaultdict
+from functools import lru_cache
+
+from django.conf import settings
+
+from core import models, utils
+from core.broker import broker
+
+
+class FreeBays:
+    """ Free car bays (no bookings) of a booking date - sorted car bay IDs, overall and per zone """
+
+    def __init__(self, bays: dict, taken: set):
+        self.zone_of = bays  # car bay id -> zone, for every car bay in the car park
+        self.ids = sorted(i for i in bays if i not in taken)
+        self.zones = defaultdict(list)
+        for i in self.ids:
+            self.zones[bays[i]].append(i)
+
+    def __contains__(self, carbay: int) -> bool:
+        i = bisect.bisect_left(self.ids, carbay)
+        return i < len(self.ids) and self.ids[i] == carbay
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def first(self) -> int | None:
+        return self.ids[0] if self.ids else None
+
+    def next_after(self, carbay: int) -> int | None:
+        """ Next free car bay after given ID - wraps around to the first """
+        i = bisect.bisect_right(self.ids, carbay)
+        return self.ids[i] if i < len(self.ids) else self.first()
+
+    def remove(self, carbay: int):
+        for ids in (self.ids, self.zones.get(self.zone_of.get(carbay), [])):
+            i = bisect.bisect_left(ids, carbay)
+            if i < len(ids) and ids[i] == carbay:
+                del ids[i]
+
+
+class FreeBaysIndex:
+    """ Per-date `FreeBays` cache - entries are rebuilt from the database after `PARKD_FREE_BAYS_TTL` seconds """
+
+    def __init__(self, max_dates: int = 400):
+        self.max_dates = max_dates
+        self.lock = threading.RLock()
+        self._dates = OrderedDict()  # date string -> (built at, FreeBays)
+        broker.connect(self.on_event)
+
+    def get(self, date: datetime.date, rebuild: bool = False) -> FreeBays:
+        key = date.isoformat()
+        ttl = settings.PARKD_FREE_BAYS_TTL
+
+        with self.lock:
+            entry = self._dates.get(key)
+            if entry and not rebuild and time.monotonic() - entry[0] < ttl:
+                self._dates.move_to_end(key)
+                return entry[1]
+
+        broker.listen()  # keep current with bookings made by other processes
+        bays = dict(models.CarBay.objects.values_list('id', 'zone'))
+        taken = set(models.Booking.objects.filter(date=date).values_list('carbay_id', flat=True))
+        free = FreeBays(bays, taken)
+
+        with self.lock:
+            self._dates[key] = (time.monotonic(), free)
+            self._dates.move_to_end(key)
+            while len(self._dates) > self.max_dates:
+                self._dates.popitem(last=False)
+        return free
+
+    def booked(self, date: str, carbay: int):
+        with self.lock:
+            if date in self._dates:
+                self._dates[date][1].remove(carbay)
+
+    def released(self, date: str, carbay: int):
+        # a concurrent booking (possibly in another process) may have taken the car bay again - rebuild on next use
+        with self.lock:
+            self._dates.pop(date, None)
+
+    def on_event(self, event: dict):
+        if event['event'] == 'booked':
+            self.booked(event['date'], event['carbay'])
+        elif event['event'] == 'released':
+            self.released(event['date'], event['carbay'])
+
+    def clear(self):
+        with self.lock:
+            self._dates.clear()
+
+
+free_bays = FreeBaysIndex()
+
+
+class AllocationStrategy:
+    """ Base allocation strategy - picks a car bay from the free car bays of the booking date """
+
+    def prepare(self, customer: models.Customer | None = None) -> dict:
+        """ Database lookups for `choose` - run before taking the process-wide free car bays lock """
+        return {}
+
+    def choose(self, free: FreeBays, customer: models.Customer | None = None, **prepared) -> int | None:
+        raise NotImplementedError
+
+
+class LowestIdStrategy(AllocationStrategy):
+    """ Always the free car bay with the lowest ID """
+
+    def choose(self, free, customer=None):
+        return free.first()
+
+
+class RoundRobinStrategy(AllocationStrategy):
+    """ Spreads bookings over the car bays (even wear) - next free car bay after the last allocated one """
+
+    def __init__(self):
+        self.last = 0
+
+    def choose(self, free, customer=None):
+        carbay = free.next_after(self.last)
+        if carbay is not None:
+            self.last = carbay
+        return carbay
+
+
+class PackByZoneStrategy(AllocationStrategy):
+    """ Fills up one zone before the next - lowest free car bay of the zone with the fewest free car bays """
+
+    def choose(self, free, customer=None):
+        zones = [(len(ids), zone) for zone, ids in free.zones.items() if ids]
+        if not zones:
+            return None
+        return free.zones[min(zones)[1]][0]
+
+
+class PreferredBayStrategy(AllocationStrategy):
+    """ Returning customers get the car bay of their last booking when free - otherwise the lowest ID """
+
+    def prepare(self, customer=None):
+        if customer and customer.pk:
+            return {'preferred': models.Booking.objects.filter(customer=customer).order_by('-date').values_list('carbay_id', flat=True).first()}
+        return {}
+
+    def choose(self, free, customer=None, preferred=None):
+        if preferred is not None and preferred in free:
+            return preferred
+        return free.first()
+
+
+STRATEGIES = {
+    'lowest_id': LowestIdStrategy,
+    'round_robin': RoundRobinStrategy,
+    'pack_by_zone': PackByZoneStrategy,
+    'preferred_bay': PreferredBayStrategy,
+}
+
+
+@lru_cache
+def _get_strategy(name: str) -> AllocationStrategy:
+    return STRATEGIES[name]()
+
+
+def get_strategy(name: str | None = None) -> AllocationStrategy:
+    """ Allocation strategy instance (one per process) - defaults to `PARKD_ALLOCATION_STRATEGY` setting """
+    return _get_strategy(name or settings.PARKD_ALLOCATION_STRATEGY)
+
+
+def allocate_car_bay(date: datetime.date, customer: models.Customer | None = None, strategy: str | None = None,
+                     starts_at: datetime.datetime | None = None, ends_at: datetime.datetime | None = None) -> int | None:
+    """ Allocate a free car bay for given booking date (whole day or time slot) - None if the car park is full """
+    whole_day = models.Booking.day_bounds(date)
+    if starts_at is None or ends_at is None:
+        starts_at, ends_at = whole_day
+
+    if (starts_at, ends_at) == whole_day:
+        free = free_bays.get(date)
+        rebuilt = False
+    else:  # time slot - car bays without overlapping bookings, straight from the database
+        taken = set(utils.get_overlapping_bookings(date, starts_at, ends_at).values_list('carbay_id', flat=True))
+        free = FreeBays(free_bays.get(date).zone_of, taken)
+        rebuilt = True
+
+    strategy = get_strategy(strategy)
+    prepared = strategy.prepare(customer)
+    while True:
+        with free_bays.lock:  # events from other threads update the same structure
+            carbay = strategy.choose(free, customer, **prepared)
+
+        if carbay is None:  # full - make sure by rebuilding from the database once
+            if rebuilt:
+                return None
+            free, rebuilt = free_bays.get(date, rebuild=True), True
+            continue
+
+        # single indexed lookup - catches car bays booked by other processes not yet seen
+        if not utils.get_overlapping_bookings(date, starts_at, ends_at).filter(carbay_id=carbay).exists():
+            return carbay
+        with free_bays.lock:
+            free.remove(carbay)
@@ -0,0 +1,124 @@
+""" Occupancy analytics
+
+Reports are served from the `DailyOccupancy` summary table (one row per date, car bay and customer) instead of the
+raw bookings. `refresh_occupancy` recomputes only the dates with bookings created/updated since the last
+refresh plus dates of deleted bookings. It only reads bookings, so booking writes are never blocked.
+"""
+import calendar
+import datetime
+
+from django.db import transaction
+from django.db.models import Count, DurationField, ExpressionWrapper, F, IntegerField, Sum
+from django.db.models.functions import ExtractWeekDay, TruncMonth
+from django.utils import timezone
+
+from core import models
+
+# bookings written just before the last refresh may have committed after it read the bookings
+REFRESH_OVERLAP = datetime.timedelta(minutes=5)
+
+GROUPS = {
+    'carbay': F('carbay'),
+    'customer': F('customer'),
+    'weekday': ExtractWeekDay('date'),  # 1 (Sunday) to 7 (Saturday)
+    'month': TruncMonth('date'),
+    'date': F('date'),
+}
+
+
+def refresh_occupancy(full: bool = False, batch_size: int = 500) -> int:
+    """ Refresh daily occupancy summaries - returns the number of dates refreshed """
+    started_at = timezone.now()
+    last_refresh = models.OccupancyRefresh.objects.first()
+    full = full or not last_refresh
+
+    if full:
+        dates = set(models.Booking.objects.values_list('date', flat=True).distinct())
+    else:
+        dates = set(models.Booking.objects.filter(last_updated__gte=last_refresh.started_at - REFRESH_OVERLAP).values_list('date', flat=True).distinct())
+    stale_dates = set(models.OccupancyStaleDate.objects.values_list('date', flat=True))
+    dates |= stale_dates
+
+    duration = ExpressionWrapper(F('ends_at') - F('starts_at'), output_field=DurationField())
+
+    with transaction.atomic():
+        if full:
+            models.DailyOccupancy.objects.all().delete()
+
+        dates = sorted(dates)
+        for i in range(0, len(dates), batch_size):
+            batch = dates[i:i + batch_size]
+            rows = (
+                models.Booking.objects.filter(date__in=batch)
+                .values('date', 'carbay', 'customer')
+                .annotate(bookings=Count('id'), booked=Sum(duration))
+                .order_by()
+            )
+            models.DailyOccupancy.objects.filter(date__in=batch).delete()
+            models.DailyOccupancy.objects.bulk_create([
+                models.DailyOccupancy(
+                    date=row['date'], carbay_id=row['carbay'], customer_id=row['customer'], bookings=row['bookings'],
+                    booked_minutes=int(row['booked'].total_seconds() // 60),
+                )
+                for row in rows
+            ])
+
+        models.OccupancyStaleDate.objects.filter(date__in=stale_dates).delete()
+        models.OccupancyRefresh.objects.create(started_at=started_at, dates=len(dates), full=full)
+
+    return len(dates)
+
+
+def get_occupancy(date_from: datetime.date, date_to: datetime.date, group_by: str = 'carbay') -> list:
+    """ Bookings, booked hours and utilization (booked share of the available car bay time) per group """
+    summaries = models.DailyOccupancy.objects.filter(date__gte=date_from, date__lte=date_to)
+    rows = (
+        summaries.annotate(group=GROUPS[group_by])
+        .values('group')
+        .annotate(bookings=Sum('bookings'), booked_minutes=Sum('booked_minutes', output_field=IntegerField()))
+        .order_by('group')
+    )
+
+    if group_by == 'carbay':  # idle car bays too - 0% utilization
+        booked = {row['group']: row for row in rows}
+        rows = [booked.get(carbay, {'group': carbay, 'bookings': 0, 'booked_minutes': 0})
+                for carbay in models.CarBay.objects.order_by('id').values_list('id', flat=True)]
+        carbays = 1
+    else:  # available minutes of all car bays
+        carbays = models.CarBay.objects.count()
+
+    data = []
+    for row in rows:
+        group = row['group']
+        available_minutes = count_days(date_from, date_to, group_by, group) * carbays * 24 * 60
+        data.append({
+            group_by: format_group(group_by, group),
+            'bookings': row['bookings'],
+            'booked_hours': round(row['booked_minutes'] / 60, 2),
+            'utilization': round(row['booked_minutes'] / available_minutes, 4) if available_minutes else 0,
+        })
+    return data
+
+
+def count_days(date_from: datetime.date, date_to: datetime.date, group_by: str, group) -> int:
+    """ Number of the days of the date range in the group - computed, so any range length is constant time """
+    days = (date_to - date_from).days + 1
+    if group_by == 'weekday':
+        weeks, remainder = divmod(days, 7)
+        weekday = (group - 2) % 7  # 1 (Sunday) to 7 (Saturday) - to Monday 0 to Sunday 6
+        return weeks + ((weekday - date_from.weekday()) % 7 < remainder)
+    if group_by == 'month':
+        month_start = datetime.date(group.year, group.month, 1)
+        month_end = month_start.replace(day=calendar.monthrange(group.year, group.month)[1])
+        return (min(date_to, month_end) - max(date_from, month_start)).days + 1
+    if group_by == 'date':
+        return 1
+    return days  # carbay and customer
+
+
+def format_group(group_by: str, group):
+    if group_by == 'weekday':
+        return calendar.day_name[(group - 2) % 7]  # 1 (Sunday) to 7 (Saturday)
+    if group_by == 'month':
+        return group.strftime('%Y-%m')
+    return group
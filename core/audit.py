@@ -0,0 +1,158 @@
+""" Booking audit log
+
+Booking attempts are appended to an in-process buffer (a lock and a deque append - microseconds) and written
+in batches by a background thread, so auditing adds no database round trip to the booking request. Events are
+bulk inserted into `BookingAuditEvent` or, with `PARKD_AUDIT_FILE` set, appended to a JSON lines file.
+
+The buffer is bounded by `PARKD_AUDIT_MAX_EVENTS` - when the writer can not keep up new events are dropped
+(and counted) instead of growing the worker's memory. Buffered events are flushed when the process exits.
+"""
+import atexit
+import json
+import logging
+import os
+import threading
+from collections import deque
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import close_old_connections
+from django.utils import timezone
+
+from core import models
+
+logger = logging.getLogger(__name__)
+
+
+class AuditLog:
+    """ Buffers audit events in-process and writes them in batches from a background thread """
+
+    def __init__(self):
+        self.events = deque()
+        self.dropped = 0
+        self.lock = threading.Lock()  # guards the buffer bound and the writer thread start
+        self.flush_lock = threading.Lock()  # one writer thread at a time
+        self.wakeup = threading.Event()
+        self.stopped = threading.Event()
+        self.thread = None
+
+    def record(self, **event) -> None:
+        """ Buffer an event (`BookingAuditEvent` field values) - never blocks on the writer """
+        event['occurred_at'] = timezone.now()
+        with self.lock:
+            if len(self.events) >= settings.PARKD_AUDIT_MAX_EVENTS:
+                self.dropped += 1
+                return
+            self.events.append(event)
+            pending = len(self.events)
+            if self.thread is None and settings.PARKD_AUDIT_FLUSH_INTERVAL > 0:
+                self.start()
+
+        if pending >= settings.PARKD_AUDIT_BATCH_SIZE:
+            self.wakeup.set()
+
+    def start(self) -> None:
+        """ Start the writer thread - lazily on the first event, so forked workers each start their own """
+        self.stopped.clear()
+        self.thread = threading.Thread(target=self.run, name='parkd-audit', daemon=True)
+        self.thread.start()
+
+    def stop(self) -> None:
+        """ Stop the writer thread and flush the buffered events """
+        self.stopped.set()
+        self.wakeup.set()
+        if self.thread is not None:
+            self.thread.join(timeout=settings.PARKD_AUDIT_FLUSH_INTERVAL + 5)
+            self.thread = None
+        self.flush()
+
+    def run(self) -> None:
+        while not self.stopped.is_set():
+            self.wakeup.wait(settings.PARKD_AUDIT_FLUSH_INTERVAL)
+            self.wakeup.clear()
+            self.flush()
+            close_old_connections()  # the thread's own database connection
+
+    def flush(self) -> int:
+        """ Write the buffered events in batches - returns the number of events written """
+        written = 0
+        with self.flush_lock:
+            while self.events:
+                batch = []
+                with self.lock:
+                    while self.events and len(batch) < settings.PARKD_AUDIT_BATCH_SIZE:
+                        batch.append(self.events.popleft())
+                try:
+                    self.write(batch)
+                    written += len(batch)
+                except Exception:  # auditing must never take the worker down
+                    logger.exception('Failed to write %d booking audit events', len(batch))
+
+            if self.dropped:
+                with self.lock:
+                    dropped, self.dropped = self.dropped, 0
+                logger.warning('Dropped %d booking audit events - buffer full (PARKD_AUDIT_MAX_EVENTS=%d)',
+                               dropped, settings.PARKD_AUDIT_MAX_EVENTS)
+        return written
+
+    def write(self, batch: list) -> None:
+        if settings.PARKD_AUDIT_FILE:
+            lines = ''.join(json.dumps(event, cls=DjangoJSONEncoder) + '\n' for event in batch)
+            # a single write to an O_APPEND file - batches of worker processes sharing the file never interleave
+            fd = os.open(settings.PARKD_AUDIT_FILE, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+            try:
+                os.write(fd, lines.encode())
+            finally:
+                os.close(fd)
+        else:
+            models.BookingAuditEvent.objects.bulk_create([models.BookingAuditEvent(**event) for event in batch])
+
+
+audit_log = AuditLog()
+atexit.register(audit_log.stop)  # flush-on-shutdown
+
+
+def record_booking(request, response) -> None:
+    """ Audit a booking attempt (POST) from its request and (success or error) response """
+    if not settings.PARKD_AUDIT_ENABLED or request.method != 'POST':
+        return
+
+    try:
+        data = request.data
+    except Exception:  # unparsable request body - the response carries the reason
+        data = {}
+    customer = data.get('customer') if isinstance(data, dict) else None
+    plate = customer.get('plate', '') if isinstance(customer, dict) else ''
+
+    if response.status_code == 201:
+        booking = response.data['data']
+        audit_log.record(
+            outcome=models.BookingAuditEvent.SUCCESS, status_code=response.status_code, date=booking['date'],
+            plate=booking['customer']['plate'], carbay_id=booking['carbay'], booking_id=booking['id'],
+        )
+    else:
+        date = data.get('date') if isinstance(data, dict) else None
+        audit_log.record(
+            outcome=models.BookingAuditEvent.REJECTED, status_code=response.status_code,
+            date=parse_date(date), plate=str(plate)[:255], reason=format_reason(response.data),
+        )
+
+
+def parse_date(value):
+    """ Booking date from a rejected request - None if missing or invalid """
+    try:
+        return timezone.datetime.strptime(str(value), '%Y-%m-%d').date()
+    except ValueError:
+        return None
+
+
+def format_reason(detail) -> str:
+    """ Plain text of an error response - the `message` or the serializer / DRF error details """
+    if isinstance(detail, dict):
+        return '; '.join(
+            format_reason(value) if key in ('message', 'detail') else f'{key}: {format_reason(value)}'
+            for key, value in detail.items()
+        )
+    if isinstance(detail, list):
+        return ' '.join(format_reason(value) for value in detail)
+    return str(detail)
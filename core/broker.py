@@ -0,0 +1,118 @@
+""" Publish/subscribe broker for live car bay availability changes
+
+Booking signals publish an event for every booked/released car bay (see core/signals.py).
+Each process holds one `AvailabilityBroker` that fans the events out to subscribers (SSE streams)
+of the booking date. With PostgreSQL the events are sent through `NOTIFY` and every process
+`LISTEN`s for them, so streams are kept current no matter which worker served the booking.
+"""
+import asyncio
+import datetime
+import json
+import logging
+import select
+import threading
+from collections import defaultdict
+
+from django.db import connection, connections, transaction
+
+logger = logging.getLogger(__name__)
+
+CHANNEL = 'parkd_availability'
+
+
+class AvailabilityBroker:
+    """ In-process broker - subscriber queues are keyed by booking date """
+
+    def __init__(self, max_queue_size: int = 100):
+        self.max_queue_size = max_queue_size
+        self._lock = threading.Lock()
+        self._subscribers = defaultdict(set)  # date string -> {(event loop, queue)}
+        self._callbacks = []
+        self._listener = None
+
+    def connect(self, callback):
+        """ Call `callback(event)` for every event dispatched in this process - e.g. to keep caches current """
+        self._callbacks.append(callback)
+
+    def subscribe(self, date: datetime.date) -> asyncio.Queue:
+        """ Subscribe to events of the given date - must be called from the subscriber's event loop """
+        queue = asyncio.Queue(maxsize=self.max_queue_size)
+        with self._lock:
+            self._subscribers[date.isoformat()].add((asyncio.get_running_loop(), queue))
+
+        self.listen()
+        return queue
+
+    def unsubscribe(self, date: datetime.date, queue: asyncio.Queue):
+        key = date.isoformat()
+        with self._lock:
+            self._subscribers[key] = {s for s in self._subscribers[key] if s[1] is not queue}
+            if not self._subscribers[key]:
+                del self._subscribers[key]
+
+    def publish(self, event: dict):
+        """ Publish an event once the current transaction (if any) commits """
+        if connection.vendor == 'postgresql':
+            # NOTIFY is transactional - delivered to every listening process on commit
+            with connection.cursor() as cursor:
+                cursor.execute('SELECT pg_notify(%s, %s)', [CHANNEL, json.dumps(event)])
+        else:
+            transaction.on_commit(lambda: self.dispatch(event))
+
+    def dispatch(self, event: dict):
+        """ Deliver an event to this process' subscribers - safe to call from any thread """
+        for callback in self._callbacks:
+            try:
+                callback(event)
+            except Exception:  # noqa - a broken callback must not stop the delivery
+                logger.exception('Availability event callback failed')
+
+        with self._lock:
+            subscribers = list(self._subscribers.get(event['date'], ()))
+
+        for loop, queue in subscribers:
+            loop.call_soon_threadsafe(self._put, queue, event)
+
+    @staticmethod
+    def _put(queue: asyncio.Queue, event: dict):
+        try:
+            queue.put_nowait(event)
+        except asyncio.QueueFull:  # slow consumer - end its stream, the client reconnects for a fresh snapshot
+            while not queue.empty():
+                queue.get_nowait()
+            queue.put_nowait(None)
+
+    def listen(self):
+        """ Start listening for events published by other processes (PostgreSQL only) """
+        if connection.vendor != 'postgresql':
+            return
+
+        with self._lock:
+            if self._listener and self._listener.is_alive():
+                return
+            self._listener = threading.Thread(target=self._listen, name='parkd-availability-listener', daemon=True)
+            self._listener.start()
+
+    def _listen(self):
+        """ LISTEN for availability notifications on a dedicated PostgreSQL connection """
+        db = connections['default']
+        conn = db.get_new_connection(db.get_connection_params())
+        conn.autocommit = True
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute(f'LISTEN {CHANNEL}')
+
+            while True:
+                if select.select([conn], [], [], 60) == ([], [], []):
+                    continue  # timeout - keep waiting
+                conn.poll()
+                while conn.notifies:
+                    notify = conn.notifies.pop(0)
+                    self.dispatch(json.loads(notify.payload))
+        except Exception:  # noqa - restarted by the next `listen()` call
+            logger.exception('Availability listener stopped')
+        finally:
+            conn.close()
+
+
+broker = AvailabilityBroker()
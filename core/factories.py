@@ -0,0 +1,33 @@
+""" Model factories for building test data """
+import datetime
+
+import factory
+
+from core import models
+
+
+class CarBayFactory(factory.django.DjangoModelFactory):
+    """ Factory for car bays in the car park """
+
+    class Meta:
+        model = models.CarBay
+
+
+class CustomerFactory(factory.django.DjangoModelFactory):
+    """ Factory for customers - plate is unique so is generated from a sequence """
+    name = factory.Faker('first_name')
+    plate = factory.Sequence(lambda n: f'T{n:08d}')
+
+    class Meta:
+        model = models.Customer
+        django_get_or_create = ('plate',)
+
+
+class BookingFactory(factory.django.DjangoModelFactory):
+    """ Factory for bookings - date defaults to tomorrow """
+    carbay = factory.SubFactory(CarBayFactory)
+    customer = factory.SubFactory(CustomerFactory)
+    date = factory.LazyFunction(lambda: datetime.date.today() + datetime.timedelta(days=1))
+
+    class Meta:
+        model = models.Booking
@@ -0,0 +1,32 @@
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+
+
+class Command(BaseCommand):
+    help = 'One-shot initialization job of Parkd project - run once per deploy before starting the API workers'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--skip-static', action='store_true', help='Do not collect staticfiles')
+
+    def handle(self, *args, **options):
+        # Migrate database
+        self.stdout.write('Running Django database migrations')
+        call_command('migrate', interactive=False)
+
+        # Collect staticfiles
+        if not options['skip_static']:
+            self.stdout.write('Collecting application staticfiles')
+            call_command('collectstatic', interactive=False, verbosity=0)
+
+        # Create superuser for Django admin access - reads DJANGO_SUPERUSER_* from environment
+        self.stdout.write('Creating Django admin superuser')
+        try:
+            call_command('createsuperuser', interactive=False, verbosity=0)
+        except CommandError as e:  # user exists or credentials not set
+            self.stdout.write(self.style.WARNING(f'Superuser not created: {e}'))
+
+        # Setup Parkd car bays
+        self.stdout.write('Setting up Car Bays for Parkd')
+        call_command('setup_car_bays')
+
+        self.stdout.write(self.style.SUCCESS('Parkd initialization complete.'))
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from core import analytics
+
+
+class Command(BaseCommand):
+    help = 'Refresh the daily occupancy summaries used by the occupancy analytics - run periodically (e.g. cron)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--full', action='store_true', help='Recompute every date instead of the changed dates only')
+
+    def handle(self, *args, **options):
+        dates = analytics.refresh_occupancy(full=options['full'])
+        self.stdout.write(
+            self.style.SUCCESS(f'Occupancy refreshed for {dates} dates{" (full refresh)" if options["full"] else ""}.')
+        )
@@ -0,0 +1,112 @@
+import asyncio
+import cProfile
+import hashlib
+import hmac
+import logging
+import pstats
+import random
+import time
+from contextlib import ExitStack
+from io import StringIO
+from pathlib import Path
+
+from asgiref.sync import async_to_sync, sync_to_async
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+
+class ProfilingMiddleware:
+    """ Profiles requests on demand - requests carrying the `X-Parkd-Profile: <PARKD_PROFILING_TOKEN>` header
+    and a `PARKD_PROFILING_SAMPLE_RATE` share of all requests. The view runs under cProfile with every SQL query
+    timed, a `Server-Timing` header summarises the request and the profile is saved to `PARKD_PROFILING_DIR` if set.
+    Removed from the middleware chain when neither a token nor a sample rate is configured (zero cost).
+    Sync and async capable - under ASGI only the profiled requests run on a sync thread.
+    """
+    header = 'HTTP_X_PARKD_PROFILE'
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if asyncio.iscoroutinefunction(self.get_response):
+            # mark the instance as a coroutine function for the handler - same as Django's MiddlewareMixin
+            self._is_coroutine = asyncio.coroutines._is_coroutine
+        self.token = settings.PARKD_PROFILING_TOKEN
+        self.sample_rate = settings.PARKD_PROFILING_SAMPLE_RATE
+        self.directory = Path(settings.PARKD_PROFILING_DIR) if settings.PARKD_PROFILING_DIR else None
+
+        if not self.token and not self.sample_rate:
+            raise MiddlewareNotUsed
+
+        if self.directory:
+            self.directory.mkdir(parents=True, exist_ok=True)
+
+    def __call__(self, request):
+        if asyncio.iscoroutinefunction(self.get_response):
+            return self.__acall__(request)
+        if not self.should_profile(request):
+            return self.get_response(request)
+        return self.profile(request, self.get_response)
+
+    async def __acall__(self, request):
+        if not self.should_profile(request):
+            return await self.get_response(request)
+        # cProfile and the SQL timing follow the current thread - the (sync) views run back on this thread
+        return await sync_to_async(self.profile)(request, async_to_sync(self.get_response))
+
+    def should_profile(self, request) -> bool:
+        token = request.META.get(self.header)
+        if token and self.token:
+            return hmac.compare_digest(token.encode(), self.token.encode())  # str compare rejects non-ASCII
+        return self.sample_rate > 0 and random.random() < self.sample_rate
+
+    def profile(self, request, get_response):
+        queries = []
+
+        def time_query(execute, sql, params, many, context):
+            start = time.perf_counter()
+            try:
+                return execute(sql, params, many, context)
+            finally:
+                queries.append((sql, time.perf_counter() - start))
+
+        profiler = cProfile.Profile()
+        start = time.perf_counter()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(time_query))
+            response = profiler.runcall(get_response, request)
+        total = time.perf_counter() - start
+
+        sql_time = sum(duration for _, duration in queries)
+        response['Server-Timing'] = (
+            f'total;dur={total * 1000:.1f}, '
+            f'sql;dur={sql_time * 1000:.1f};desc="{len(queries)} queries"'
+        )
+
+        if self.directory:
+            name = self.profile_name(request)
+            try:
+                profiler.dump_stats(self.directory / name)
+                response['X-Parkd-Profile'] = name
+            except OSError:  # profiling never changes the response
+                logger.exception('Failed to save profile %s', name)
+
+        stats = StringIO()
+        pstats.Stats(profiler, stream=stats).sort_stats('cumulative').print_stats(15)
+        slowest = '\n'.join(f'{duration * 1000:8.2f}ms  {sql}' for sql, duration in sorted(queries, key=lambda q: -q[1])[:10])
+        logger.info('Profiled %s %s in %.1fms - %d queries in %.1fms\n%s\n%s',
+                    request.method, request.get_full_path(), total * 1000, len(queries), sql_time * 1000, slowest, stats.getvalue())
+        return response
+
+    @staticmethod
+    def profile_name(request) -> str:
+        """ Profile file name - timestamp, method and the path (shortened with a hash when long) """
+        path = request.path.strip('/').replace('/', '_') or 'root'
+        if len(path) > 64:
+            path = f'{path[:48]}-{hashlib.sha1(path.encode()).hexdigest()[:12]}'
+        return f'{timezone.now():%Y%m%dT%H%M%S%f}-{request.method}-{path}.prof'
@@ -0,0 +1,18 @@
+# Generated by Django 4.0.6 on 2026-10-19 19:11
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0002_alter_booking_options_alter_carbay_options_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='carbay',
+            name='zone',
+            field=models.CharField(blank=True, default='', help_text='Used by the pack by zone allocation strategy', max_length=50, verbose_name='Zone'),
+        ),
+    ]
@@ -0,0 +1,77 @@
+# Generated by Django 4.0.6 on 2026-10-19 19:13
+
+import datetime
+
+from django.db import migrations, models
+import django.db.models.expressions
+from django.utils import timezone
+
+
+def set_whole_day_times(apps, schema_editor):
+    """ Existing bookings are whole day bookings - midnight to next midnight """
+    Booking = apps.get_model('core', 'Booking')
+    for booking in Booking.objects.all().iterator():
+        booking.starts_at = timezone.make_aware(datetime.datetime.combine(booking.date, datetime.time.min))
+        booking.ends_at = booking.starts_at + datetime.timedelta(days=1)
+        booking.save(update_fields=['starts_at', 'ends_at'])
+
+
+def add_no_overlap_constraint(apps, schema_editor):
+    """ PostgreSQL only: a car bay can not have overlapping bookings - GiST index on car bay and time range """
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('CREATE EXTENSION IF NOT EXISTS btree_gist')
+    schema_editor.execute(
+        'ALTER TABLE core_booking ADD CONSTRAINT booking_no_overlap '
+        'EXCLUDE USING gist (carbay_id WITH =, tstzrange(starts_at, ends_at, \'[)\') WITH &&)'
+    )
+
+
+def remove_no_overlap_constraint(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('ALTER TABLE core_booking DROP CONSTRAINT IF EXISTS booking_no_overlap')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0003_carbay_zone'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='booking',
+            name='starts_at',
+            field=models.DateTimeField(null=True, help_text='Defaults to the start of the day (midnight)', verbose_name='Starts At'),
+        ),
+        migrations.AddField(
+            model_name='booking',
+            name='ends_at',
+            field=models.DateTimeField(null=True, help_text='Defaults to the end of the day (next midnight)', verbose_name='Ends At'),
+        ),
+        migrations.RunPython(set_whole_day_times, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='booking',
+            name='starts_at',
+            field=models.DateTimeField(help_text='Defaults to the start of the day (midnight)', verbose_name='Starts At'),
+        ),
+        migrations.AlterField(
+            model_name='booking',
+            name='ends_at',
+            field=models.DateTimeField(help_text='Defaults to the end of the day (next midnight)', verbose_name='Ends At'),
+        ),
+        migrations.RemoveConstraint(
+            model_name='booking',
+            name='unique_booking',
+        ),
+        migrations.AddIndex(
+            model_name='booking',
+            index=models.Index(fields=['date', 'carbay'], name='booking_date_carbay_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='booking',
+            constraint=models.CheckConstraint(check=models.Q(('starts_at__lt', django.db.models.expressions.F('ends_at'))), name='booking_starts_before_ends'),
+        ),
+        migrations.RunPython(add_no_overlap_constraint, remove_no_overlap_constraint),
+    ]
@@ -0,0 +1,53 @@
+# Generated by Django 4.0.6 on 2026-10-19 19:17
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0004_booking_time_slots'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OccupancyRefresh',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('started_at', models.DateTimeField(db_index=True, verbose_name='Started At')),
+                ('finished_at', models.DateTimeField(auto_now_add=True, verbose_name='Finished At')),
+                ('dates', models.PositiveIntegerField(default=0, verbose_name='Dates Refreshed')),
+                ('full', models.BooleanField(default=False, verbose_name='Full Refresh')),
+            ],
+            options={
+                'ordering': ['-started_at'],
+            },
+        ),
+        migrations.CreateModel(
+            name='OccupancyStaleDate',
+            fields=[
+                ('date', models.DateField(primary_key=True, serialize=False, verbose_name='Date')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='DailyOccupancy',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('last_updated', models.DateTimeField(auto_now=True)),
+                ('date', models.DateField(db_index=True, verbose_name='Date')),
+                ('bookings', models.PositiveIntegerField(default=0, verbose_name='Bookings')),
+                ('booked_minutes', models.PositiveIntegerField(default=0, verbose_name='Booked Minutes')),
+                ('carbay', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='core.carbay')),
+            ],
+            options={
+                'verbose_name_plural': 'Daily occupancies',
+                'ordering': ['-date', 'carbay'],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='dailyoccupancy',
+            constraint=models.UniqueConstraint(fields=('date', 'carbay'), name='unique_daily_occupancy'),
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 4.0.6 on 2026-10-19 19:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0005_occupancy_summary'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BookingAuditEvent',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False, verbose_name='Audit Event ID')),
+                ('occurred_at', models.DateTimeField(db_index=True, verbose_name='Occurred At')),
+                ('outcome', models.CharField(choices=[('success', 'Success'), ('rejected', 'Rejected')], max_length=10, verbose_name='Outcome')),
+                ('reason', models.TextField(blank=True, default='', verbose_name='Rejected Reason')),
+                ('status_code', models.PositiveSmallIntegerField(verbose_name='Response Status Code')),
+                ('date', models.DateField(blank=True, null=True, verbose_name='Booking Date')),
+                ('plate', models.CharField(blank=True, default='', max_length=255, verbose_name='Licence Plate')),
+                ('carbay_id', models.BigIntegerField(blank=True, null=True, verbose_name='Allocated Car Bay ID')),
+                ('booking_id', models.UUIDField(blank=True, null=True, verbose_name='Booking ID')),
+            ],
+            options={
+                'ordering': ['-occurred_at'],
+            },
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 4.0.6 on 2026-10-19 20:02
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def clear_occupancy(apps, schema_editor):
+    """ Summaries gain the customer dimension - drop them and the refresh log so the next refresh is a full one """
+    apps.get_model('core', 'DailyOccupancy').objects.all().delete()
+    apps.get_model('core', 'OccupancyRefresh').objects.all().delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0006_booking_audit_event'),
+    ]
+
+    operations = [
+        migrations.RunPython(clear_occupancy, migrations.RunPython.noop),
+        migrations.RemoveConstraint(
+            model_name='dailyoccupancy',
+            name='unique_daily_occupancy',
+        ),
+        migrations.AddField(
+            model_name='dailyoccupancy',
+            name='customer',
+            field=models.ForeignKey(default=None, on_delete=django.db.models.deletion.CASCADE, to='core.customer'),
+            preserve_default=False,
+        ),
+        migrations.AddConstraint(
+            model_name='dailyoccupancy',
+            constraint=models.UniqueConstraint(fields=('date', 'carbay', 'customer'), name='unique_daily_occupancy'),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 4.0.6 on 2026-10-19 19:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0007_daily_occupancy_customer'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='booking',
+            index=models.Index(fields=['last_updated', 'date'], name='booking_updated_date_idx'),
+        ),
+    ]
@@ -1,6 +1,8 @@
+import datetime
 import uuid
 
 from django.db import models
+from django.utils import timezone
 
 
 class TimeStampedModel(models.Model):
@@ -15,6 +17,7 @@ class TimeStampedModel(models.Model):
 class CarBay(TimeStampedModel):
     """ A model for car bays in the car park """
     id = models.BigAutoField('Car Bay ID', primary_key=True)
+    zone = models.CharField('Zone', max_length=50, blank=True, default='', help_text='Used by the pack by zone allocation strategy')
 
     class Meta:
         ordering = ['id']
@@ -41,17 +44,106 @@ class Customer(TimeStampedModel):
 
 
 class Booking(TimeStampedModel):
-    """ The core booking model for Park'd """
+    """ The core booking model for Park'd - a whole day (`date`) or a time slot within the day """
     id = models.UUIDField('Booking ID', primary_key=True, unique=True, default=uuid.uuid4, editable=False, db_index=True)
     carbay = models.ForeignKey(CarBay, on_delete=models.CASCADE)
     customer = models.ForeignKey(Customer, on_delete=models.CASCADE)
     date = models.DateField('Date Booked', db_index=True)
+    starts_at = models.DateTimeField('Starts At', help_text='Defaults to the start of the day (midnight)')
+    ends_at = models.DateTimeField('Ends At', help_text='Defaults to the end of the day (next midnight)')
+
+    # PostgreSQL: no overlapping bookings of a car bay - EXCLUDE USING gist (see migration 0004)
+    NO_OVERLAP_CONSTRAINT = 'booking_no_overlap'
 
     class Meta:
         constraints = (
-            models.UniqueConstraint(fields=['date', 'carbay'], name='unique_booking'),
+            models.CheckConstraint(check=models.Q(starts_at__lt=models.F('ends_at')), name='booking_starts_before_ends'),
+        )
+        indexes = (
+            models.Index(fields=['date', 'carbay'], name='booking_date_carbay_idx'),
+            models.Index(fields=['last_updated', 'date'], name='booking_updated_date_idx'),  # incremental occupancy refresh
         )
         ordering = ['-date', '-created_at']
 
     def __str__(self) -> str:
         return f'[{self.date}] {self.carbay} - {self.customer}'
+
+    def save(self, *args, **kwargs):
+        # whole day booking unless a time slot is given
+        if self.starts_at is None or self.ends_at is None:
+            day_start, day_end = self.day_bounds(self.date)
+            self.starts_at = self.starts_at or day_start
+            self.ends_at = self.ends_at or day_end
+        super().save(*args, **kwargs)
+
+    @classmethod
+    def day_bounds(cls, date: datetime.date) -> tuple[datetime.datetime, datetime.datetime]:
+        """ Start (midnight) and end (next midnight) of given date in the project time zone """
+        date = cls._meta.get_field('date').to_python(date)
+        start = timezone.make_aware(datetime.datetime.combine(date, datetime.time.min))
+        return start, timezone.make_aware(datetime.datetime.combine(date + datetime.timedelta(days=1), datetime.time.min))
+
+
+class DailyOccupancy(TimeStampedModel):
+    """ Summary of the bookings of a car bay by a customer per day for occupancy analytics - see `refresh_occupancy` command """
+    date = models.DateField('Date', db_index=True)
+    carbay = models.ForeignKey(CarBay, on_delete=models.CASCADE)
+    customer = models.ForeignKey(Customer, on_delete=models.CASCADE)
+    bookings = models.PositiveIntegerField('Bookings', default=0)
+    booked_minutes = models.PositiveIntegerField('Booked Minutes', default=0)
+
+    class Meta:
+        constraints = (
+            models.UniqueConstraint(fields=['date', 'carbay', 'customer'], name='unique_daily_occupancy'),
+        )
+        ordering = ['-date', 'carbay']
+        verbose_name_plural = 'Daily occupancies'
+
+    def __str__(self) -> str:
+        return f'[{self.date}] {self.carbay} - {self.customer} - {self.bookings} bookings, {self.booked_minutes} minutes'
+
+
+class OccupancyStaleDate(models.Model):
+    """ Dates of deleted bookings - their daily occupancy is recomputed on the next refresh """
+    date = models.DateField('Date', primary_key=True)
+
+    def __str__(self) -> str:
+        return str(self.date)
+
+
+class OccupancyRefresh(models.Model):
+    """ Log of daily occupancy refreshes - bookings updated since the last one are refreshed incrementally """
+    started_at = models.DateTimeField('Started At', db_index=True)
+    finished_at = models.DateTimeField('Finished At', auto_now_add=True)
+    dates = models.PositiveIntegerField('Dates Refreshed', default=0)
+    full = models.BooleanField('Full Refresh', default=False)
+
+    class Meta:
+        ordering = ['-started_at']
+
+    def __str__(self) -> str:
+        return f'Occupancy refresh at {self.started_at} - {self.dates} dates'
+
+
+class BookingAuditEvent(models.Model):
+    """ Append-only audit trail of booking attempts - written in batches by core/audit.py """
+    SUCCESS = 'success'
+    REJECTED = 'rejected'
+    OUTCOMES = ((SUCCESS, 'Success'), (REJECTED, 'Rejected'))
+
+    id = models.BigAutoField('Audit Event ID', primary_key=True)
+    occurred_at = models.DateTimeField('Occurred At', db_index=True)
+    outcome = models.CharField('Outcome', max_length=10, choices=OUTCOMES)
+    reason = models.TextField('Rejected Reason', blank=True, default='')
+    status_code = models.PositiveSmallIntegerField('Response Status Code')
+    date = models.DateField('Booking Date', null=True, blank=True)
+    plate = models.CharField('Licence Plate', max_length=255, blank=True, default='')
+    # plain values (no foreign keys) - the audit trail outlives deleted car bays and bookings
+    carbay_id = models.BigIntegerField('Allocated Car Bay ID', null=True, blank=True)
+    booking_id = models.UUIDField('Booking ID', null=True, blank=True)
+
+    class Meta:
+        ordering = ['-occurred_at']
+
+    def __str__(self) -> str:
+        return f'[{self.occurred_at}] {self.outcome} {self.plate} {self.date} {self.reason or self.carbay_id}'
@@ -0,0 +1,43 @@
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from core import models
+from core.broker import broker
+
+
+def publish_availability_event(event: str, booking: models.Booking):
+    # `date` holds whatever was assigned (date, datetime or string) - normalize it to a date
+    date = models.Booking._meta.get_field('date').to_python(booking.date)
+    broker.publish({
+        'event': event,
+        'date': date.isoformat(),
+        'carbay': booking.carbay_id,
+        'starts_at': booking.starts_at.isoformat(),
+        'ends_at': booking.ends_at.isoformat(),
+    })
+
+
+@receiver(pre_save, sender=models.Booking)
+def booking_moving(sender, instance: models.Booking, **kwargs):
+    """ Mark the old date for occupancy refresh when a booking is moved to another date (e.g. in the admin) """
+    if instance._state.adding:
+        return
+    old_date = models.Booking.objects.filter(pk=instance.pk).values_list('date', flat=True).first()
+    if old_date and old_date != models.Booking._meta.get_field('date').to_python(instance.date):
+        models.OccupancyStaleDate.objects.bulk_create([models.OccupancyStaleDate(date=old_date)], ignore_conflicts=True)
+
+
+@receiver(post_save, sender=models.Booking)
+def booking_saved(sender, instance: models.Booking, created: bool, **kwargs):
+    """ Publish car bay booked event for live availability streams """
+    if created:
+        publish_availability_event('booked', instance)
+
+
+@receiver(post_delete, sender=models.Booking)
+def booking_deleted(sender, instance: models.Booking, **kwargs):
+    """ Publish car bay released event for live availability streams and mark the date for occupancy refresh """
+    # streams list car bays free for the whole day - released only once no time slot of the day is left booked
+    if not models.Booking.objects.filter(carbay_id=instance.carbay_id, date=instance.date).exists():
+        publish_availability_event('released', instance)
+    models.OccupancyStaleDate.objects.bulk_create([models.OccupancyStaleDate(date=instance.date)], ignore_conflicts=True)
@@ -0,0 +1,305 @@
+import asyncio
+import json
+import tempfile
+from datetime import date, timedelta
+from io import StringIO
+from pathlib import Path
+
+from unittest import skipUnless
+
+from asgiref.sync import async_to_sync, sync_to_async
+from django.core.exceptions import MiddlewareNotUsed
+from django.core.management import call_command
+from django.db import IntegrityError, connection
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+
+from core import allocation, audit, factories, middleware, models
+
+
+class InitParkdCommandTests(TestCase):
+
+    def test_init_parkd(self):
+        """
+        GIVEN a migrated database with no car bays
+        WHEN the one-shot `init_parkd` job is run
+        THEN car bays are initialized
+        AND running the job again is a no-op (idempotent)
+        """
+        out = StringIO()
+        call_command('init_parkd', '--skip-static', stdout=out)
+        self.assertEqual(models.CarBay.objects.count(), 4)
+        self.assertTrue('initialization complete' in out.getvalue())
+
+        call_command('init_parkd', '--skip-static', stdout=StringIO())
+        self.assertEqual(models.CarBay.objects.count(), 4)
+
+
+class FreeBaysTests(SimpleTestCase):
+
+    def setUp(self):
+        # car bays 1-6, zone A: 1-2, zone B: 3-6 - car bays 2 and 5 booked
+        self.free = allocation.FreeBays({1: 'A', 2: 'A', 3: 'B', 4: 'B', 5: 'B', 6: 'B'}, taken={2, 5})
+
+    def test_free_bays(self):
+        """
+        GIVEN free car bays of a date with car bays 2 and 5 booked
+        WHEN another car bay is booked
+        THEN free car bays stay sorted overall and per zone
+        """
+        self.assertEqual(self.free.ids, [1, 3, 4, 6])
+        self.assertEqual(dict(self.free.zones), {'A': [1], 'B': [3, 4, 6]})
+        self.assertEqual(self.free.next_after(4), 6)
+        self.assertEqual(self.free.next_after(6), 1)  # wraps around
+
+        self.free.remove(3)
+        self.assertEqual(self.free.ids, [1, 4, 6])
+        self.assertEqual(dict(self.free.zones), {'A': [1], 'B': [4, 6]})
+        self.assertFalse(3 in self.free)
+
+    def test_strategies(self):
+        """
+        GIVEN free car bays of a date with car bays 2 and 5 booked
+        WHEN each allocation strategy chooses a car bay
+        THEN lowest id chooses 1, round robin chooses 1, 3, 4 and pack by zone chooses 1 (zone A is fuller)
+        """
+        self.assertEqual(allocation.LowestIdStrategy().choose(self.free), 1)
+
+        strategy = allocation.RoundRobinStrategy()
+        self.assertEqual([strategy.choose(self.free) for _ in range(3)], [1, 3, 4])
+
+        self.assertEqual(allocation.PackByZoneStrategy().choose(self.free), 1)
+        self.free.remove(1)
+        self.assertEqual(allocation.PackByZoneStrategy().choose(self.free), 3)
+
+
+@override_settings(PARKD_FREE_BAYS_TTL=300)
+class AllocateCarBayTests(TestCase):
+
+    def setUp(self):
+        self.date = date.today() + timedelta(days=7)
+        allocation.free_bays.clear()
+
+    @classmethod
+    def setUpTestData(cls):
+        call_command('setup_car_bays', stdout=StringIO())
+        cls.bays = list(models.CarBay.objects.order_by('id').values_list('id', flat=True))
+
+    def test_allocate_incremental(self):
+        """
+        GIVEN free car bays of a date cached in-process
+        WHEN a booking is committed and another one made behind the cache (not yet seen)
+        THEN the committed booking updates the cache from its event without a database rebuild
+        AND the unseen booking is detected and skipped
+        """
+        self.assertEqual(allocation.allocate_car_bay(self.date), self.bays[0])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            factories.BookingFactory(date=self.date, carbay_id=self.bays[0])
+        self.assertEqual(allocation.free_bays.get(self.date).ids, self.bays[1:])
+
+        with self.captureOnCommitCallbacks(execute=False):  # event not delivered
+            factories.BookingFactory(date=self.date, carbay_id=self.bays[1])
+        self.assertEqual(allocation.allocate_car_bay(self.date), self.bays[2])
+
+    def test_allocate_full(self):
+        """
+        GIVEN all car bays booked for a date
+        WHEN a car bay is allocated
+        THEN no car bay is allocated
+        """
+        for carbay in models.CarBay.objects.all():
+            factories.BookingFactory(date=self.date, carbay=carbay)
+        self.assertIsNone(allocation.allocate_car_bay(self.date))
+
+    def test_allocate_preferred_bay(self):
+        """
+        GIVEN a returning customer who booked the third car bay before
+        WHEN a car bay is allocated with the preferred bay strategy
+        THEN the third car bay is allocated to the returning customer
+        AND a new customer gets the lowest free car bay
+        AND the preferred car bay is looked up before the free car bays lock is taken
+        """
+        booking = factories.BookingFactory(date=self.date - timedelta(days=1), carbay_id=self.bays[2])
+        strategy = allocation.get_strategy('preferred_bay')
+        prepared = strategy.prepare(booking.customer)
+        free = allocation.free_bays.get(self.date)
+        with self.assertNumQueries(0):
+            self.assertEqual(strategy.choose(free, booking.customer, **prepared), self.bays[2])
+
+        self.assertEqual(allocation.allocate_car_bay(self.date, booking.customer, strategy='preferred_bay'), self.bays[2])
+        self.assertEqual(allocation.allocate_car_bay(self.date, strategy='preferred_bay'), self.bays[0])
+
+
+@skipUnless(connection.vendor == 'postgresql', 'exclusion constraint is PostgreSQL only')
+class BookingNoOverlapConstraintTests(TestCase):
+
+    def test_overlapping_bookings(self):
+        """
+        GIVEN a car bay booked from 09:00 to 12:00
+        WHEN the same car bay is booked from 12:00 to 14:00 and from 11:00 to 13:00
+        THEN the adjacent booking is saved
+        AND the overlapping booking is rejected by the database
+        """
+        booking = factories.BookingFactory()
+        day_start, _ = models.Booking.day_bounds(booking.date)
+        booking.starts_at, booking.ends_at = day_start + timedelta(hours=9), day_start + timedelta(hours=12)
+        booking.save()
+
+        factories.BookingFactory(carbay=booking.carbay, date=booking.date,
+                                 starts_at=day_start + timedelta(hours=12), ends_at=day_start + timedelta(hours=14))
+
+        with self.assertRaises(IntegrityError):
+            factories.BookingFactory(carbay=booking.carbay, date=booking.date,
+                                     starts_at=day_start + timedelta(hours=11), ends_at=day_start + timedelta(hours=13))
+
+
+class ProfilingMiddlewareTests(TestCase):
+
+    @staticmethod
+    def view(request):
+        return HttpResponse(str(models.CarBay.objects.count()))
+
+    def test_disabled(self):
+        """
+        GIVEN no profiling token and no sample rate configured
+        WHEN the profiling middleware is loaded
+        THEN it is removed from the middleware chain
+        """
+        with self.assertRaises(MiddlewareNotUsed):
+            middleware.ProfilingMiddleware(self.view)
+
+    @override_settings(PARKD_PROFILING_TOKEN='s3cret')
+    def test_profile_authorized_request(self):
+        """
+        GIVEN a profiling token configured
+        WHEN requests are made with the right token, a wrong (also non-ASCII) token and no token
+        THEN only the request with the right token is profiled
+        AND its response has a `Server-Timing` header with the SQL query count
+        AND the profile and the SQL queries are logged
+        """
+        profiling = middleware.ProfilingMiddleware(self.view)
+
+        for token in ['wrong', 'wrong-ünïcode', None]:
+            headers = {'HTTP_X_PARKD_PROFILE': token} if token else {}
+            response = profiling(RequestFactory().get('/api/bookings/', **headers))
+            self.assertFalse(response.has_header('Server-Timing'))
+
+        with self.assertLogs('core.middleware', level='INFO') as logs:
+            response = profiling(RequestFactory().get('/api/bookings/', HTTP_X_PARKD_PROFILE='s3cret'))
+        self.assertTrue('desc="1 queries"' in response['Server-Timing'])
+        self.assertTrue('core_carbay' in logs.output[0])
+
+    def test_profile_sampled_request(self):
+        """
+        GIVEN a sample rate of 1 (all requests) and a profiles directory configured
+        WHEN a request is made
+        THEN the request is profiled
+        AND the profile file is saved to the profiles directory and named in `X-Parkd-Profile` header
+        """
+        with tempfile.TemporaryDirectory() as directory:
+            with override_settings(PARKD_PROFILING_SAMPLE_RATE=1.0, PARKD_PROFILING_DIR=directory), self.assertLogs('core.middleware'):
+                response = middleware.ProfilingMiddleware(self.view)(RequestFactory().get('/api/bookings/'))
+
+            self.assertTrue(response.has_header('Server-Timing'))
+            self.assertTrue((Path(directory) / response['X-Parkd-Profile']).is_file())
+
+    def test_profile_long_path(self):
+        """
+        GIVEN a sample rate of 1 (all requests) and a profiles directory configured
+        WHEN a request is made for a very long path
+        THEN the profile file is saved under a shortened name
+        AND when the profile can not be saved the error is logged and the response is returned unchanged
+        """
+        request = RequestFactory().get('/api/' + 'x' * 300 + '/')
+        with tempfile.TemporaryDirectory() as directory:
+            with override_settings(PARKD_PROFILING_SAMPLE_RATE=1.0, PARKD_PROFILING_DIR=directory), self.assertLogs('core.middleware'):
+                profiling = middleware.ProfilingMiddleware(self.view)
+                response = profiling(request)
+            self.assertLess(len(response['X-Parkd-Profile']), 128)
+            self.assertTrue((Path(directory) / response['X-Parkd-Profile']).is_file())
+
+        with self.assertLogs('core.middleware', level='ERROR'):  # directory removed
+            response = profiling(request)
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(response.has_header('X-Parkd-Profile'))
+
+    @override_settings(PARKD_PROFILING_TOKEN='s3cret')
+    def test_profile_async(self):
+        """
+        GIVEN a profiling token configured and an async handler (ASGI)
+        WHEN requests are made with no token and with the right token
+        THEN the middleware is a coroutine function awaiting the handler directly for the request with no token
+        AND the request with the right token is profiled with its SQL queries
+        """
+        async def view(request):
+            return await sync_to_async(self.view)(request)
+
+        profiling = middleware.ProfilingMiddleware(view)
+        self.assertTrue(asyncio.iscoroutinefunction(profiling))
+
+        response = async_to_sync(profiling)(RequestFactory().get('/api/bookings/'))
+        self.assertFalse(response.has_header('Server-Timing'))
+
+        with self.assertLogs('core.middleware', level='INFO'):
+            response = async_to_sync(profiling)(RequestFactory().get('/api/bookings/', HTTP_X_PARKD_PROFILE='s3cret'))
+        self.assertTrue('desc="1 queries"' in response['Server-Timing'])
+
+
+@override_settings(PARKD_AUDIT_BATCH_SIZE=2, PARKD_AUDIT_MAX_EVENTS=3)
+class AuditLogTests(TestCase):
+
+    def setUp(self):
+        self.audit_log = audit.AuditLog()
+
+    def record(self, count: int):
+        for i in range(count):
+            self.audit_log.record(outcome=models.BookingAuditEvent.REJECTED, status_code=400, plate=f'{i}23456789',
+                                  date=date.today(), reason='Only 1 booking allowed per customer per day')
+
+    def test_flush_batches(self):
+        """
+        GIVEN a batch size of 2 and a buffer of 3 audit events
+        WHEN 4 events are recorded and the audit log is flushed
+        THEN the 4th event is dropped and a warning is logged
+        AND the 3 buffered events are bulk inserted in 2 batches (2 queries) and the buffer is emptied
+        """
+        self.record(4)
+        self.assertEqual(self.audit_log.dropped, 1)
+
+        with self.assertLogs('core.audit', level='WARNING'), self.assertNumQueries(2):
+            self.assertEqual(self.audit_log.flush(), 3)
+        self.assertEqual(models.BookingAuditEvent.objects.count(), 3)
+        self.assertEqual(len(self.audit_log.events), 0)
+        self.assertEqual(self.audit_log.dropped, 0)
+
+    def test_flush_to_file(self):
+        """
+        GIVEN an audit file configured
+        WHEN events are recorded and flushed twice
+        THEN the events are appended to the file as JSON lines and not written to the database
+        """
+        with tempfile.TemporaryDirectory() as directory, override_settings(PARKD_AUDIT_FILE=f'{directory}/audit.log'):
+            for _ in range(2):
+                self.record(2)
+                self.audit_log.flush()
+
+            lines = Path(directory, 'audit.log').read_text().splitlines()
+        self.assertEqual(len(lines), 4)
+        self.assertEqual(json.loads(lines[0])['plate'], '023456789')
+        self.assertEqual(models.BookingAuditEvent.objects.count(), 0)
+
+    @override_settings(PARKD_AUDIT_FILE='/nonexistent/audit.log', PARKD_AUDIT_FLUSH_INTERVAL=60)
+    def test_background_writer(self):
+        """
+        GIVEN the background writer thread configured
+        WHEN a full batch of events is recorded
+        THEN the writer thread is started and woken up to write the batch
+        AND a failing write is logged without raising, and the writer thread stops on shutdown
+        """
+        with self.assertLogs('core.audit', level='ERROR'):
+            self.record(2)
+            self.assertTrue(self.audit_log.thread.is_alive())
+            self.audit_log.stop()
+        self.assertIsNone(self.audit_log.thread)
+        self.assertEqual(len(self.audit_log.events), 0)
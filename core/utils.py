@@ -1,13 +1,47 @@
 import datetime
 
-from django.db.models import QuerySet
+from django.conf import settings
+from django.db.models import Exists, OuterRef, QuerySet
 from django.utils import timezone
 
 from core import models
 
 
-def get_available_car_bays(date: datetime) -> QuerySet:
-    return models.CarBay.objects.exclude(booking__date=date)
+def get_available_car_bays(date: datetime, starts_at: datetime = None, ends_at: datetime = None) -> QuerySet:
+    if starts_at is None or ends_at is None or (starts_at, ends_at) == models.Booking.day_bounds(date):
+        # whole day - any booking of the day takes the car bay
+        return models.CarBay.objects.exclude(booking__date=date)
+    return models.CarBay.objects.exclude(Exists(get_overlapping_bookings(date, starts_at, ends_at).filter(carbay=OuterRef('pk'))))
+
+
+def get_overlapping_bookings(date: datetime, starts_at: datetime, ends_at: datetime) -> QuerySet:
+    # bookings never cross midnight - the `date` index narrows down to the day before the range overlap check
+    return models.Booking.objects.filter(date=date, starts_at__lt=ends_at, ends_at__gt=starts_at)
+
+
+def get_time_slot(date: datetime, starts: str, ends: str) -> tuple[datetime.datetime, datetime.datetime]:
+    """ Time slot `HH:MM`-`HH:MM` within given date (`24:00` is the next midnight) - raises ValueError if invalid """
+    day_start, day_end = models.Booking.day_bounds(date)
+    slot_minutes = settings.PARKD_SLOT_MINUTES
+
+    bounds = []
+    for value in (starts, ends):
+        if not isinstance(value, str):  # e.g. a number in the JSON request body
+            raise ValueError('Time slot `start` and `end` must be strings - format HH:MM')
+        if value == '24:00':
+            offset = datetime.timedelta(days=1)
+        else:
+            time = datetime.datetime.strptime(value, '%H:%M').time()
+            offset = datetime.timedelta(hours=time.hour, minutes=time.minute)
+
+        if int(offset.total_seconds()) // 60 % slot_minutes:
+            raise ValueError(f'Time slots must be in steps of {slot_minutes} minutes')
+        bounds.append(day_start + offset)
+
+    starts_at, ends_at = bounds
+    if not day_start <= starts_at < ends_at <= day_end:
+        raise ValueError('Time slot must start before it ends within the booking date')
+    return starts_at, ends_at
 
 
 def customer_allowed_to_book(date: datetime, plate: str) -> bool:
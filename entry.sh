@@ -1,28 +1,28 @@
 #!/usr/bin/env bash
 
 # Run automated tests only if RUN_TYPE=TEST
+# Tests run in parallel on an in-memory SQLite database (see config/settings_test.py)
 if [[ "${RUN_TYPE}" = "TEST" ]]; then
-  python manage.py test
+  python manage.py test --settings=config.settings_test --parallel
   exit $?
 fi
 
-# Migrate database
-printf "\nRunning Django database migrations\n"
-python manage.py migrate --no-input
-
-# Collect staticfiles
-printf "\nCollecting application staticfiles\n"
-python manage.py collectstatic --no-input
-
-# Create superuser for Django admin access
-# User exists error ignored (stderr > null)
-printf "\nCreating Django admin superuser\n"
-python manage.py createsuperuser --no-input 2>/dev/null
-
-# Setup Parkd car bays
-printf "\nSetting up Car Bays for Parkd\n"
-python manage.py setup_car_bays
+# Run one-shot initialization job only if RUN_TYPE=INIT
+# Migrations, staticfiles, superuser and car bays setup (see core/management/commands/init_parkd.py)
+# Always uses the full settings as the API-only settings skip admin, auth, sessions etc.
+if [[ "${RUN_TYPE}" = "INIT" ]]; then
+  printf "\nRunning Parkd initialization job\n"
+  python manage.py init_parkd --settings=config.settings
+  exit $?
+fi
 
-# Run development server
-printf "\nRunning Django development server\n"
-python manage.py runserver 0.0.0.0:8000
+# Run ASGI server (required for the Server-Sent Events streams) - initialization is done by the one-shot INIT job
+# Set DJANGO_SETTINGS_MODULE=config.settings_api for lean API-only workers
+# Django runs the sync views of a worker process one at a time - WEB_WORKERS processes (default 2 x CPUs + 1)
+# serve the API concurrently, each one also serving any number of streams
+printf "\nRunning uvicorn ASGI server\n"
+if [[ "${DEBUG}" = "True" ]]; then
+  uvicorn config.asgi:application --host 0.0.0.0 --port 8000 --reload
+else
+  uvicorn config.asgi:application --host 0.0.0.0 --port 8000 --workers "${WEB_WORKERS:-$(( $(nproc) * 2 + 1 ))}"
+fi